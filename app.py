@@ -1,71 +1,128 @@
 import gradio as gr
-from modules.voice_processing import process_voice_input
-from modules.image_processing import summarize_image
-from modules.todo_list import add_todo_item, get_todo_list
+from modules.multimodal_processing import process_multimodal_input, split_media_files
+from modules.todo_list import add_todo_item, complete_todo_item, remove_todo_item, get_todo_list
+from modules.todo_store import get_todo_store
 from modules.bulletin_board import get_bulletin_board, create_or_update_group_bulletin
-from modules.agent_responses import get_agent_response, get_agent_advice
-from modules.user_management import authenticate, register_user, get_user_data, get_user_group, get_group_agent_id, ensure_group_agent_exists, load_users
+from modules.agent_responses import stream_agent_response, stream_agent_advice
+from modules.user_management import authenticate, register_user, get_user_data, get_user_group, get_group_agent_id, ensure_group_agent_exists, reconcile_groups, groups_ready
+from modules.group_data_storage import load_group_data
+from modules.scheduler import scheduler
+from modules.tracing import traced, start_metrics_server, METRICS_PORT
 
 import os
+import threading
 from pathlib import Path
 
 # Ensure necessary directories exist
 Path("stored_images").mkdir(exist_ok=True)
 Path("image_summaries").mkdir(exist_ok=True)
 
-def process_multimodal(audio, image, model_choice, current_input):
-    # Process voice input
-    voice_text = process_voice_input(audio) if audio else ""
-    
-    # Process image input
-    image_summary = ""
-    if image:
-        try:
-            result = summarize_image(image, model=model_choice)
-            if result['summary'].startswith("Error processing image"):
-                image_summary = result['summary']
-            else:
-                image_summary = f"Image processed with {model_choice} (ID: {result['image_id']}):\n{result['summary']}"
-        except Exception as e:
-            image_summary = f"Error processing image: {str(e)}"
-    
-    # Combine voice input and image summary
-    new_input = f"Voice input: {voice_text}\n\nImage summary: {image_summary}".strip()
+@traced("app.process_multimodal")
+def process_multimodal(audio, image, extra_files, model_choice, current_input):
+    # Voice transcription and image summaries run concurrently
+    extra_audio, extra_images, skipped = split_media_files(extra_files)
+    new_input = process_multimodal_input(
+        ([audio] if audio else []) + extra_audio,
+        ([image] if image else []) + extra_images,
+        model=model_choice,
+    )
+    if skipped:
+        new_input += "\n\nSkipped unsupported file(s): " + ", ".join(Path(file_path).name for file_path in skipped)
     
     # Append new input to current input
     combined_input = f"{current_input}\n\n{new_input}".strip()
     
     return combined_input
 
-def submit_to_agent(input_text, username, show_details, history):
-    agent_response = get_agent_response(input_text, username, detailed=show_details)
-    history.append((input_text, agent_response))
-    return "", history  # Return empty string to clear input box
+def notify_group_activity(username):
+    group = get_user_group(username)
+    if group:
+        scheduler.request_refresh(group)
 
-def update_todo(todo_item, group_name, group_agent_id):
-    updated_todo = add_todo_item(todo_item, group_name, group_agent_id)
+@traced("app.submit_to_agent")
+def submit_to_agent(input_text, username, show_details, history):
+    history.append((input_text, "⏳ ..."))
+    yield "", history  # Return empty string to clear input box
+    for partial_response in stream_agent_response(input_text, username, detailed=show_details):
+        history[-1] = (input_text, partial_response)
+        yield "", history
+    notify_group_activity(username)
+
+@traced("app.update_todo")
+def update_todo(todo_item, group_name, group_agent_id, username):
+    if not todo_item.strip():
+        return get_todo_list(group_name, group_agent_id)
+    # Stored instantly; reprioritization happens in the background
+    updated_todo = add_todo_item(todo_item.strip(), group_name, group_agent_id, owner=username or None)
+    scheduler.request_refresh(group_name, artifacts=["todo"])
     return updated_todo
 
+@traced("app.complete_todo")
+def complete_todo(item_id, group_name, group_agent_id):
+    if not complete_todo_item(item_id.strip(), group_name):
+        gr.Warning(f"No to-do item with id {item_id!r}.")
+    return get_todo_list(group_name, group_agent_id)
+
+@traced("app.remove_todo")
+def remove_todo(item_id, group_name, group_agent_id):
+    if not remove_todo_item(item_id.strip(), group_name):
+        gr.Warning(f"No to-do item with id {item_id!r}.")
+    return get_todo_list(group_name, group_agent_id)
+
+@traced("app.update_bulletin")
 def update_bulletin(new_item, group_name, group_agent_id):
     updated_bulletin = create_or_update_group_bulletin(group_name, group_agent_id, new_item)
     return updated_bulletin
 
+@traced("app.refresh_bulletin")
 def refresh_bulletin(group_name, group_agent_id):
     return create_or_update_group_bulletin(group_name, group_agent_id)
 
+@traced("app.request_advice")
 def request_advice(username, show_details, history):
-    advice = get_agent_advice(username, detailed=show_details)
-    history.append(("Can you provide some advice?", advice))
-    return history
-
+    history.append(("Can you provide some advice?", "⏳ ..."))
+    yield history
+    for partial_advice in stream_agent_advice(username, detailed=show_details):
+        history[-1] = ("Can you provide some advice?", partial_advice)
+        yield history
+    notify_group_activity(username)
+
+def load_group_artifact(group, artifact):
+    content = load_group_data(group, artifact)
+    if content is None:
+        # Nothing persisted yet; have the background worker build it right away
+        scheduler.request_refresh(group, artifacts=[artifact], delay=0)
+    return content
+
+@traced("app.show_bulletin")
+def show_bulletin(group, agent_id):
+    if not group or not agent_id:
+        return ""
+    bulletin = load_group_artifact(group, "bulletin") or "_The bulletin board is being prepared. Check back in a moment._"
+    return f"## {group} Bulletin Board\n\n{bulletin}"
+
+@traced("app.show_todo")
+def show_todo(group, agent_id):
+    if not group or not agent_id:
+        return ""
+    if not get_todo_store().items(group):
+        # Nothing stored yet; have the background worker build a first list right away
+        scheduler.request_refresh(group, artifacts=["todo"], delay=0)
+    return get_todo_list(group, agent_id)
+
+@traced("app.login")
 def login(username, password):
     if authenticate(username, password):
         group = get_user_group(username)
         group_agent_id = ensure_group_agent_exists(group) if group else None
+        if group:
+            scheduler.register_group(group)
+            scheduler.request_refresh(group)
         return f"Welcome, {username}!", get_user_data(username), username, group, group_agent_id
     else:
         return "Invalid username or password", "", "", "", ""
 
+@traced("app.register")
 def register(username, password, group):
     if register_user(username, password, group):
         group_agent_id = get_group_agent_id(group)
@@ -74,13 +131,20 @@ def register(username, password, group):
         return "Username already exists. Please choose a different one."
 
 def update_all_groups():
-    users = load_users()
-    unique_groups = set(user_data.get('group') for user_data in users.values() if user_data.get('group'))
-    for group in unique_groups:
-        ensure_group_agent_exists(group)
+    for group in reconcile_groups():
+        scheduler.register_group(group)
 
-# Call this function once when the app starts
-update_all_groups()
+def startup_status():
+    if groups_ready.is_set():
+        return "✅ Ready"
+    return "⏳ Still reconciling groups in the background; your first login may take a little longer."
+
+# Reconcile groups in the background so the server can accept requests right away;
+# login ensures its own group's agent exists either way
+threading.Thread(target=update_all_groups, name="update-all-groups", daemon=True).start()
+scheduler.start()
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
 
 with gr.Blocks() as demo:
     gr.Markdown("# Worlds In-Silico Family Assistant")
@@ -95,6 +159,7 @@ with gr.Blocks() as demo:
         login_button = gr.Button("Login")
         register_button = gr.Button("Register")
         login_output = gr.Textbox(label="Login Status")
+        server_status = gr.Markdown(startup_status)
     
     with gr.Tab("Main Interface"):
         user_data = gr.Textbox(label="User Data")
@@ -106,11 +171,16 @@ with gr.Blocks() as demo:
                 todo_list = gr.Markdown(label="Family To-Do List")
                 todo_input = gr.Textbox(label="Add Todo Item")
                 todo_button = gr.Button("Update To-Do List")
+                todo_item_id = gr.Textbox(label="To-Do Item ID")
+                with gr.Row():
+                    todo_done_button = gr.Button("Mark Done")
+                    todo_remove_button = gr.Button("Remove")
 
             with gr.Column(scale=2):
                 with gr.Row():
                     voice_input = gr.Audio(type="filepath", label="Voice Input")
                     image_input = gr.Image(label="Image Input", type="filepath")
+                extra_media_input = gr.File(label="More Images/Audio (optional)", file_count="multiple", type="filepath")
                 model_choice = gr.Radio(["gpt-4o-mini", "gpt-4o", "claude-3-5-sonnet-20240620"], 
                                         label="Choose Model", 
                                         value="gpt-4o-mini")
@@ -142,7 +212,7 @@ with gr.Blocks() as demo:
         # Connect components
         process_button.click(
             process_multimodal, 
-            inputs=[voice_input, image_input, model_choice, input_box], 
+            inputs=[voice_input, image_input, extra_media_input, model_choice, input_box], 
             outputs=input_box
         )
         submit_button.click(
@@ -152,9 +222,11 @@ with gr.Blocks() as demo:
         )
         todo_button.click(
             update_todo,
-            inputs=[todo_input, user_group, group_agent_id],
+            inputs=[todo_input, user_group, group_agent_id, current_user],
             outputs=todo_list
         )
+        todo_done_button.click(complete_todo, inputs=[todo_item_id, user_group, group_agent_id], outputs=todo_list)
+        todo_remove_button.click(remove_todo, inputs=[todo_item_id, user_group, group_agent_id], outputs=todo_list)
         update_bulletin_button.click(
             update_bulletin,
             inputs=[bulletin_input, user_group, group_agent_id],
@@ -166,16 +238,16 @@ with gr.Blocks() as demo:
         login_button.click(login, inputs=[username_input, password_input], outputs=[login_output, user_data, current_user, user_group, group_agent_id])
         register_button.click(register, inputs=[username_input, password_input, group_input], outputs=login_output)
 
-        # Update bulletin board on login
+        # Show the latest persisted bulletin board on login; regeneration happens in the background
         login_button.click(
-            lambda group, agent_id: f"## {group} Bulletin Board\n\n{create_or_update_group_bulletin(group, agent_id)}" if group and agent_id else "",
+            show_bulletin,
             inputs=[user_group, group_agent_id],
             outputs=bulletin_board
         )
 
-        # Update todo list on login
+        # Show the stored todo list on login
         login_button.click(
-            lambda group, agent_id: get_todo_list(group, agent_id) if group and agent_id else "",
+            show_todo,
             inputs=[user_group, group_agent_id],
             outputs=todo_list
         )
@@ -0,0 +1,295 @@
+"""Deterministic local stand-ins for the letta, OpenAI and Anthropic clients.
+
+Each fake sleeps for a configurable latency instead of doing network I/O and
+counts its calls, so benchmarks measure our own code plus a known, repeatable
+amount of waiting.
+"""
+import hashlib
+import json
+import queue
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from letta.schemas.message import MessageRole
+
+TODO_PHRASES = [
+    "I need to buy groceries before Friday",
+    "Don't forget the dentist appointment on Tuesday",
+    "We should book the flights for the holidays",
+    "Remind me to pay the electricity bill",
+    "Can you add renewing the car insurance to my tasks?",
+    "I have to finish the school project by Monday",
+    "Pick up the dry cleaning after work",
+]
+CHATTER_PHRASES = [
+    "The weather was lovely today",
+    "We watched a great movie last night",
+    "Dinner at grandma's was fun",
+    "The kids played in the park for hours",
+    "Work was busy but productive",
+    "I tried a new recipe for pasta",
+]
+EXISTING_TODO_LINE = re.compile(r"^- ([0-9a-f]{8}) \| ([^|]*) \| (.*)$", re.MULTILINE)
+
+class Latency:
+    """Simulated service time: ``base`` seconds plus ``per_kb`` seconds per KB of request payload."""
+
+    def __init__(self, base=0.0, per_kb=0.0, jitter=0.0, seed=0):
+        self.base = base
+        self.per_kb = per_kb
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self, payload_bytes=0):
+        delay = self.base + self.per_kb * payload_bytes / 1024
+        if self.jitter:
+            with self._lock:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.counts)
+
+def _digest(*parts):
+    return hashlib.sha256("\x00".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+class _SyntheticHistory:
+    """An agent's messages and passages, materialized one page at a time.
+
+    Item ``i`` is generated from its index, so a 100k-message history costs
+    nothing until it is read. Items created during the benchmark are kept in
+    real lists after the synthetic ones.
+    """
+
+    def __init__(self, agent_id, messages, passages, span, seed):
+        self.agent_id = agent_id
+        self.synthetic_messages = messages
+        self.synthetic_passages = passages
+        self.end = datetime.now(timezone.utc)
+        self.span = span
+        self.seed = seed
+        self.extra_messages = []
+        self.extra_passages = []
+
+    def _created_at(self, index, count):
+        if count <= 1:
+            return self.end
+        return self.end - self.span * (count - 1 - index) / (count - 1)
+
+    def message(self, index):
+        if index >= self.synthetic_messages:
+            return self.extra_messages[index - self.synthetic_messages]
+        rng = random.Random(_digest(self.seed, self.agent_id, "m", index))
+        created_at = self._created_at(index, self.synthetic_messages)
+        message_id = f"{self.agent_id}-m{index}"
+        if index % 2 == 0:
+            phrases = TODO_PHRASES if rng.random() < 0.3 else CHATTER_PHRASES
+            return make_user_message(message_id, created_at, rng.choice(phrases))
+        return make_assistant_message(message_id, created_at, rng.choice(CHATTER_PHRASES))
+
+    def passage(self, index):
+        if index >= self.synthetic_passages:
+            return self.extra_passages[index - self.synthetic_passages]
+        rng = random.Random(_digest(self.seed, self.agent_id, "p", index))
+        created_at = self._created_at(index, self.synthetic_passages)
+        return SimpleNamespace(id=f"{self.agent_id}-p{index}", created_at=created_at, text=rng.choice(TODO_PHRASES + CHATTER_PHRASES))
+
+    def message_count(self):
+        return self.synthetic_messages + len(self.extra_messages)
+
+    def passage_count(self):
+        return self.synthetic_passages + len(self.extra_passages)
+
+def make_user_message(message_id, created_at, text):
+    payload = {'type': 'user_message', 'message': text, 'time': created_at.strftime("%Y-%m-%d %I:%M:%S %p")}
+    return SimpleNamespace(id=message_id, created_at=created_at, role=MessageRole.user, text=json.dumps(payload), tool_calls=None)
+
+def make_assistant_message(message_id, created_at, text):
+    tool_call = SimpleNamespace(function=SimpleNamespace(name='send_message', arguments=json.dumps({'message': text})))
+    return SimpleNamespace(id=message_id, created_at=created_at, role=MessageRole.assistant, text=None, tool_calls=[tool_call])
+
+def _index(item_id):
+    return int(item_id.rsplit("-", 1)[1][1:])
+
+def _page(get_item, count, before, after, limit):
+    # Newest first, with before/after as id cursors like letta's
+    upper = count - 1 if before is None else _index(before) - 1
+    lower = 0 if after is None else _index(after) + 1
+    if limit is None:
+        limit = count
+    return [get_item(index) for index in range(upper, max(lower, upper - limit + 1) - 1, -1)]
+
+class FakeLettaClient:
+    def __init__(self, latency=None, messages_per_agent=200, passages_per_agent=20, history_span=timedelta(days=30), seed=0):
+        self.latency = latency or Latency()
+        self.messages_per_agent = messages_per_agent
+        self.passages_per_agent = passages_per_agent
+        self.history_span = history_span
+        self.seed = seed
+        self.calls = CallCounter()
+        self.interface = SimpleNamespace(buffer=queue.Queue())
+        self._lock = threading.Lock()
+        self._agent_ids = {}
+        self._histories = {}
+
+    def _history(self, agent_id):
+        with self._lock:
+            history = self._histories.get(agent_id)
+            if history is None:
+                history = self._histories[agent_id] = _SyntheticHistory(
+                    agent_id, self.messages_per_agent, self.passages_per_agent, self.history_span, self.seed
+                )
+            return history
+
+    def create_agent(self, name, memory=None, **kwargs):
+        self.calls.count("letta.create_agent")
+        self.latency.sleep()
+        with self._lock:
+            agent_id = self._agent_ids.setdefault(name, f"agent-{_digest(self.seed, name)[:12]}")
+        return SimpleNamespace(id=agent_id, name=name)
+
+    def get_agent_id(self, agent_name):
+        self.calls.count("letta.get_agent_id")
+        with self._lock:
+            return self._agent_ids.get(agent_name)
+
+    def delete_agent(self, agent_id):
+        self.calls.count("letta.delete_agent")
+        with self._lock:
+            self._histories.pop(agent_id, None)
+
+    def user_message(self, agent_id, message):
+        self.calls.count("letta.user_message")
+        # A fresh buffer per request, like letta's QueuingInterface
+        buffer = self.interface.buffer = queue.Queue()
+        reply = f"Noted: {message[:200]}"
+        buffer.put({'internal_monologue': "Thinking about the user's message."})
+        self.latency.sleep(len(message.encode("utf-8")))
+        buffer.put({'assistant_message': reply})
+
+        history = self._history(agent_id)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            count = history.message_count()
+            history.extra_messages.append(make_user_message(f"{agent_id}-m{count}", now, message))
+            history.extra_messages.append(make_assistant_message(f"{agent_id}-m{count + 1}", now, reply))
+        return SimpleNamespace(messages=[
+            SimpleNamespace(internal_monologue="Thinking about the user's message."),
+            SimpleNamespace(function_call=SimpleNamespace(name='send_message', arguments=json.dumps({'message': reply}))),
+        ])
+
+    def get_messages(self, agent_id, before=None, after=None, limit=1000):
+        self.calls.count("letta.get_messages")
+        self.latency.sleep()
+        history = self._history(agent_id)
+        return _page(history.message, history.message_count(), before, after, limit)
+
+    def get_archival_memory(self, agent_id, before=None, after=None, limit=1000):
+        self.calls.count("letta.get_archival_memory")
+        self.latency.sleep()
+        history = self._history(agent_id)
+        return _page(history.passage, history.passage_count(), before, after, limit)
+
+    def get_in_context_memory(self, agent_id):
+        self.calls.count("letta.get_in_context_memory")
+        self.latency.sleep()
+        return SimpleNamespace(persona="A helpful digital companion.", human=f"Owner of {agent_id}")
+
+    def get_archival_memory_summary(self, agent_id):
+        self.calls.count("letta.get_archival_memory_summary")
+        self.latency.sleep()
+        return SimpleNamespace(size=self._history(agent_id).passage_count())
+
+    def get_recall_memory_summary(self, agent_id):
+        self.calls.count("letta.get_recall_memory_summary")
+        self.latency.sleep()
+        return SimpleNamespace(size=self._history(agent_id).message_count())
+
+def _fake_completion(messages, response_format):
+    prompt = "\n".join(str(message.get('content')) for message in messages)
+    digest = _digest(prompt)
+    if response_format and response_format.get('type') == 'json_object':
+        # Keep what the prompt listed and add one task, like a reprioritization pass would
+        items = [
+            {'id': item_id, 'owner': owner.strip() if owner.strip() != '-' else None, 'text': text}
+            for item_id, owner, text in EXISTING_TODO_LINE.findall(prompt)
+        ]
+        items.append({'id': None, 'owner': None, 'text': f"Follow up on item {digest[:6]}"})
+        return json.dumps({'items': items, 'done': []})
+    return "\n".join(f"- 📌 Update {digest[index:index + 6]}" for index in range(0, 24, 6))
+
+class _FakeChatCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, response_format=None, **kwargs):
+        self.owner.calls.count(f"openai.chat.completions.create[{model}]")
+        self.owner.latency.sleep(len(json.dumps(messages).encode("utf-8")))
+        content = _fake_completion(messages, response_format)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class _FakeTranscriptions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, file, **kwargs):
+        self.owner.calls.count(f"openai.audio.transcriptions.create[{model}]")
+        # The openai SDK takes either a file object or a (filename, bytes) tuple
+        data = file[1] if isinstance(file, tuple) else file.read()
+        self.owner.latency.sleep(len(data))
+        return SimpleNamespace(text=f"Transcript {_digest(data)[:8]}")
+
+class _FakeEmbeddings:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, input, dimensions=256, **kwargs):
+        self.owner.calls.count(f"openai.embeddings.create[{model}]")
+        self.owner.latency.sleep(len(json.dumps(input).encode("utf-8")))
+        # Deterministic per text, so repeated runs rank passages the same way
+        data = []
+        for index, text in enumerate(input):
+            rng = random.Random(_digest(text))
+            data.append(SimpleNamespace(index=index, embedding=[rng.gauss(0, 1) for _ in range(dimensions)]))
+        return SimpleNamespace(data=data)
+
+class FakeOpenAI:
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.calls = CallCounter()
+        self.chat = SimpleNamespace(completions=_FakeChatCompletions(self))
+        self.audio = SimpleNamespace(transcriptions=_FakeTranscriptions(self))
+        self.embeddings = _FakeEmbeddings(self)
+
+class _FakeMessages:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, max_tokens=None, **kwargs):
+        self.owner.calls.count(f"anthropic.messages.create[{model}]")
+        payload = json.dumps(messages)
+        self.owner.latency.sleep(len(payload.encode("utf-8")))
+        return SimpleNamespace(content=[SimpleNamespace(text=f"An image described as {_digest(payload)[:8]}.")])
+
+class FakeAnthropic:
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.calls = CallCounter()
+        self.messages = _FakeMessages(self)
@@ -0,0 +1,250 @@
+"""Offline benchmarks for the app's hot paths.
+
+Runs login, submit_to_agent, bulletin and todo regeneration and image
+summaries against local fake clients and synthetic data, then reports
+latency percentiles, client call counts and peak traced memory per path.
+
+    python -m benchmarks.run --preset medium
+    python -m benchmarks.run --users 2000 --group-size 20 --messages 50000 --json results.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PATHS = ["login", "submit_to_agent", "bulletin", "todo", "summarize_image"]
+PRESETS = {
+    "small": {'users': 100, 'group_size': 5, 'messages': 1000, 'passages': 100},
+    "medium": {'users': 1000, 'group_size': 10, 'messages': 10000, 'passages': 1000},
+    "large": {'users': 10000, 'group_size': 50, 'messages': 100000, 'passages': 10000},
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    parser.add_argument("--users", type=int, help="number of registered users")
+    parser.add_argument("--group-size", type=int, help="members per group")
+    parser.add_argument("--messages", type=int, help="synthetic messages per agent")
+    parser.add_argument("--passages", type=int, help="synthetic archival passages per agent")
+    parser.add_argument("--history-days", type=float, default=30, help="time span of each synthetic history")
+    parser.add_argument("--iterations", type=int, default=20, help="runs per path")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--letta-latency", type=float, default=0.005, help="seconds per fake letta call")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="base seconds per fake LLM call")
+    parser.add_argument("--llm-per-kb", type=float, default=0.001, help="extra fake LLM seconds per KB of prompt")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative latency jitter, e.g. 0.2 for ±20%%")
+    parser.add_argument("--image-model", default="gpt-4o-mini")
+    parser.add_argument("--image-size", type=int, default=2048, help="edge length of the synthetic images")
+    parser.add_argument("--storage", choices=["sqlite", "json"], default="sqlite")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the persistent LLM response cache enabled")
+    parser.add_argument("--rate-limits", action="store_true", help="apply the provider rate limits to the fake clients too")
+    parser.add_argument("--cold-snapshots", action="store_true", help="clear the agent snapshot cache before every run")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip memory tracing, which slows every path down")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    args = parser.parse_args(argv)
+    for key, value in PRESETS[args.preset].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    return args
+
+def configure_environment(args, workdir):
+    # Module settings are read at import time, so this must run before any modules.* import
+    os.environ.update({
+        "WIS_STORAGE_BACKEND": args.storage,
+        "WIS_DATABASE_FILE": str(workdir / "wis.db"),
+        "WIS_LLM_CACHE_FILE": str(workdir / "llm_cache.db"),
+        "WIS_LLM_CACHE_ENABLED": "1" if args.llm_cache else "0",
+        "WIS_GOVERNOR_ENABLED": "1" if args.rate_limits else "0",
+    })
+    # Traces outlive the working directory, so keep them where the benchmark was started
+    os.environ.setdefault("WIS_TRACE_FILE", str(Path("traces.jsonl").absolute()))
+    os.environ.setdefault("WIS_METRICS_FILE", str(Path("metrics.prom").absolute()))
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def make_image(path, size, seed):
+    from PIL import Image
+    rng = random.Random(seed)
+    image = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    image.save(path, format="PNG")
+    return path
+
+def build_paths(args, workdir, groups, fakes):
+    from benchmarks.synthetic import PASSWORD
+    from modules.user_management import authenticate, get_user_group, ensure_group_agent_exists, get_user_data, get_group_agent_id
+    from modules.agent_responses import stream_agent_response
+    from modules.bulletin_board import create_or_update_group_bulletin
+    from modules.todo_list import create_or_update_todo_list, get_todo_list
+    from modules.group_data_storage import load_group_data
+    from modules.group_context import snapshot_cache
+    from modules.image_processing import summarize_image
+
+    rng = random.Random(args.seed)
+    usernames = [username for members in groups.values() for username in members]
+    group_names = sorted(groups)
+    group_agents = {group: get_group_agent_id(group) for group in group_names}
+
+    def cold():
+        if args.cold_snapshots:
+            snapshot_cache.clear()
+
+    def login(iteration):
+        # What the login handler and the artifacts shown on login do
+        username = rng.choice(usernames)
+        authenticate(username, PASSWORD)
+        group = get_user_group(username)
+        agent_id = ensure_group_agent_exists(group)
+        get_user_data(username)
+        get_todo_list(group, agent_id)
+        load_group_data(group, "bulletin")
+
+    def submit_to_agent(iteration):
+        for _ in stream_agent_response(f"Benchmark message {iteration}: need to buy milk", rng.choice(usernames)):
+            pass
+
+    def bulletin(iteration):
+        cold()
+        group = group_names[iteration % len(group_names)]
+        create_or_update_group_bulletin(group, group_agents[group])
+
+    def todo(iteration):
+        cold()
+        group = group_names[iteration % len(group_names)]
+        create_or_update_todo_list(group, group_agents[group])
+
+    images = []
+    if "summarize_image" in args.paths:
+        image_dir = workdir / "benchmark_images"
+        image_dir.mkdir(exist_ok=True)
+        images = [make_image(image_dir / f"image_{i}.png", args.image_size, args.seed + i) for i in range(args.iterations)]
+
+    def image(iteration):
+        summarize_image(images[iteration], model=args.image_model)
+
+    return {
+        "login": login,
+        "submit_to_agent": submit_to_agent,
+        "bulletin": bulletin,
+        "todo": todo,
+        "summarize_image": image,
+    }
+
+def call_counts(fakes):
+    counts = Counter()
+    for fake in fakes:
+        counts.update(fake.calls.snapshot())
+    return counts
+
+def measure(name, fn, iterations, fakes, trace):
+    before = call_counts(fakes)
+    if trace:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    latencies = []
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        fn(iteration)
+        latencies.append(time.perf_counter() - start)
+    peak = tracemalloc.get_traced_memory()[1] - baseline if trace else None
+    calls = call_counts(fakes) - before
+
+    latencies.sort()
+    return {
+        'path': name,
+        'iterations': iterations,
+        'mean_ms': 1000 * sum(latencies) / len(latencies),
+        'p50_ms': 1000 * percentile(latencies, 0.50),
+        'p95_ms': 1000 * percentile(latencies, 0.95),
+        'p99_ms': 1000 * percentile(latencies, 0.99),
+        'max_ms': 1000 * latencies[-1],
+        'peak_memory_mb': peak / 2**20 if peak is not None else None,
+        'calls': dict(sorted(calls.items())),
+    }
+
+def format_report(args, results):
+    out = io.StringIO()
+    out.write(
+        f"users={args.users} group_size={args.group_size} messages={args.messages} passages={args.passages} "
+        f"iterations={args.iterations} storage={args.storage}\n\n"
+    )
+    out.write(f"{'path':<16}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'peak MB':>10}\n")
+    for result in results:
+        peak = f"{result['peak_memory_mb']:.1f}" if result['peak_memory_mb'] is not None else "-"
+        out.write(
+            f"{result['path']:<16}{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+            f"{result['p99_ms']:>10.1f}{result['max_ms']:>10.1f}{peak:>10}\n"
+        )
+    out.write("\nClient calls per path:\n")
+    for result in results:
+        calls = ", ".join(f"{name}={count}" for name, count in result['calls'].items()) or "none"
+        out.write(f"  {result['path']}: {calls}\n")
+    return out.getvalue()
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = Path(tempfile.mkdtemp(prefix="wis-bench-"))
+    cwd = os.getcwd()
+    configure_environment(args, workdir)
+    try:
+        from benchmarks.fakes import Latency, FakeLettaClient, FakeOpenAI, FakeAnthropic
+        from benchmarks.synthetic import populate
+        from modules.clients import set_client
+        from modules.storage import get_storage
+
+        letta = FakeLettaClient(
+            Latency(args.letta_latency, jitter=args.jitter, seed=args.seed),
+            messages_per_agent=args.messages,
+            passages_per_agent=args.passages,
+            history_span=timedelta(days=args.history_days),
+            seed=args.seed,
+        )
+        openai = FakeOpenAI(Latency(args.llm_latency, args.llm_per_kb, args.jitter, args.seed))
+        anthropic = FakeAnthropic(Latency(args.llm_latency, args.llm_per_kb, args.jitter, args.seed))
+        set_client("letta", letta)
+        set_client("openai", openai)
+        set_client("anthropic", anthropic)
+        fakes = [letta, openai, anthropic]
+
+        groups = populate(get_storage(), letta, args.users, args.group_size)
+        paths = build_paths(args, workdir, groups, fakes)
+
+        trace = not args.no_tracemalloc
+        if trace:
+            tracemalloc.start()
+        results = [measure(name, paths[name], args.iterations, fakes, trace) for name in args.paths]
+        if trace:
+            tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(format_report(args, results))
+    if args.json:
+        args.json.write_text(json.dumps({'config': vars(args), 'results': results}, indent=2, default=str))
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Synthetic users and groups for benchmarks."""
+import math
+
+PASSWORD = "benchmark"
+
+def username(index):
+    return f"user{index:05d}"
+
+def group_name(index):
+    return f"group{index:04d}"
+
+def populate(storage, letta_client, users, group_size):
+    """Register ``users`` users in groups of ``group_size`` directly in storage.
+
+    Agents are created on the fake letta client so their ids resolve, but the
+    registration path itself is bypassed; only its end state matters here.
+    Returns ``{group_name: [usernames]}``.
+    """
+    group_count = max(1, math.ceil(users / group_size))
+    user_records = {}
+    groups = {}
+    for group_index in range(group_count):
+        name = group_name(group_index)
+        agent = letta_client.create_agent(name=f"group_{name}")
+        groups[name] = {'members': [], 'agent_id': agent.id, 'agent_name': agent.name}
+
+    for index in range(users):
+        name = username(index)
+        agent = letta_client.create_agent(name=f"agent_{name}")
+        group = group_name(index // group_size)
+        user_records[name] = {'password': PASSWORD, 'agent_id': agent.id, 'agent_name': agent.name, 'group': group}
+        groups[group]['members'].append(name)
+
+    storage.replace_users(user_records)
+    storage.replace_groups(groups)
+    return {name: group['members'] for name, group in groups.items()}
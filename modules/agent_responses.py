@@ -1,29 +1,223 @@
 import json
-from letta import LocalClient, LettaMessage
-from modules.user_management import get_user_agent_id
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules.clients import get_letta_client, agent_client
+from modules.user_management import get_user_agent_id, get_group_members
+from modules.group_context import invalidate_agent_snapshot, iter_completed
+from modules.llm_cache import get_response_cache, cache_key, LLM_CACHE_ENABLED
+from modules.call_governor import background_priority, is_rate_limited
 
-letta_client = LocalClient()
+ADVICE_PROMPT = "Can you provide some advice?"
+
+# Agent runs take turns on the one letta client, so more workers would only
+# queue there while their timeouts run
+BROADCAST_MAX_WORKERS = int(os.getenv("WIS_BROADCAST_MAX_WORKERS", "1"))
+BROADCAST_TIMEOUT = float(os.getenv("WIS_BROADCAST_TIMEOUT", "120"))
+BROADCAST_RETRIES = int(os.getenv("WIS_BROADCAST_RETRIES", "2"))
+BROADCAST_RETRY_BACKOFF = 1.0
+
+# Separate from the agent-data pool: agent steps are slow and would starve snapshot fetches
+_broadcast_executor = ThreadPoolExecutor(max_workers=BROADCAST_MAX_WORKERS, thread_name_prefix="agent-broadcast")
 
 def get_agent_response(input_text, username, detailed=False):
     agent_id = get_user_agent_id(username)
     if agent_id:
-        response = letta_client.user_message(
-            agent_id=agent_id,
-            message=input_text,
-        )
+        with agent_client() as client:
+            response = client.user_message(
+                agent_id=agent_id,
+                message=input_text,
+            )
+        invalidate_agent_snapshot(agent_id)
         return process_agent_messages(response.messages, detailed)
     return "Error: User agent not found"
 
-def get_agent_advice(username, detailed=False):
+def _is_undelivered(error):
+    # Rate limits and failed connections are raised before the agent's step
+    # stores anything; after other errors the message may already be saved
+    return is_rate_limited(error) or isinstance(error, ConnectionError) or type(error).__name__ == "APIConnectionError"
+
+class _AgentMessage:
+    def __init__(self, agent_id, message, retries):
+        self.agent_id = agent_id
+        self.message = message
+        self.retries = retries
+        self.attempts = 0
+
+    def __call__(self):
+        for attempt in range(self.retries + 1):
+            self.attempts = attempt + 1
+            try:
+                # Queued behind interactive agent runs
+                with background_priority(), agent_client() as client:
+                    response = client.user_message(agent_id=self.agent_id, message=self.message)
+            except Exception as e:
+                if attempt == self.retries or not _is_undelivered(e):
+                    raise
+                time.sleep(BROADCAST_RETRY_BACKOFF * 2 ** attempt)
+            else:
+                invalidate_agent_snapshot(self.agent_id)
+                return response
+
+def message_agents(agents, message, detailed=False, timeout=BROADCAST_TIMEOUT, retries=BROADCAST_RETRIES):
+    """Send ``message`` to every agent and yield replies as they complete.
+
+    ``agents`` maps usernames to agent ids. Each yielded dict has the
+    ``username``, ``agent_id``, formatted ``response`` (None on failure),
+    ``error`` and number of ``attempts``. Sends rejected by a rate limit or
+    a failed connection are retried with exponential backoff; the timeout
+    covers all of an agent's attempts from when its first one starts. Other
+    failures and timeouts are not retried, since the agent may already have
+    stored the message and would then see it twice. Agent runs take turns on
+    the shared letta client, behind any interactive ones.
+    """
+    jobs = {username: _AgentMessage(agent_id, message, retries) for username, agent_id in agents.items()}
+    for username, response, error in iter_completed(jobs, timeout, executor=_broadcast_executor):
+        yield {
+            'username': username,
+            'agent_id': agents[username],
+            'response': process_agent_messages(response.messages, detailed) if error is None else None,
+            'error': error,
+            'attempts': jobs[username].attempts,
+        }
+
+def broadcast_to_group(group_name, message, detailed=False, **kwargs):
+    return message_agents(get_group_members(group_name), message, detailed, **kwargs)
+
+def get_group_advice(group_name, detailed=False, **kwargs):
+    return message_agents(get_group_members(group_name), ADVICE_PROMPT, detailed, **kwargs)
+
+def _advice_cache(use_cache):
+    return get_response_cache() if use_cache and LLM_CACHE_ENABLED else None
+
+def _advice_cache_key(agent_id, detailed):
+    # Recall memory grows with every stored message, so its size identifies the agent's state
+    state = get_letta_client().get_recall_memory_summary(agent_id).size
+    return cache_key(f"letta:{agent_id}", "advice", ADVICE_PROMPT, detailed, state)
+
+def get_agent_advice(username, detailed=False, use_cache=True):
     agent_id = get_user_agent_id(username)
     if agent_id:
-        response = letta_client.user_message(
-            agent_id=agent_id,
-            message="Can you provide some advice?",
-        )
-        return process_agent_messages(response.messages, detailed)
+        cache = _advice_cache(use_cache)
+        if cache is not None:
+            cached = cache.get(_advice_cache_key(agent_id, detailed))
+            if cached is not None:
+                return cached
+        with agent_client() as client:
+            response = client.user_message(
+                agent_id=agent_id,
+                message=ADVICE_PROMPT,
+            )
+        invalidate_agent_snapshot(agent_id)
+        advice = process_agent_messages(response.messages, detailed)
+        if cache is not None:
+            # Keyed on the state after answering, so asking again with nothing new in between is a hit
+            cache.put(_advice_cache_key(agent_id, detailed), advice)
+        return advice
     return "Error: User agent not found"
 
+def stream_agent_response(input_text, username, detailed=False):
+    agent_id = get_user_agent_id(username)
+    if agent_id:
+        yield from stream_user_message(agent_id, input_text, detailed)
+    else:
+        yield "Error: User agent not found"
+
+def stream_agent_advice(username, detailed=False, use_cache=True):
+    agent_id = get_user_agent_id(username)
+    if agent_id:
+        cache = _advice_cache(use_cache)
+        if cache is not None:
+            cached = cache.get(_advice_cache_key(agent_id, detailed))
+            if cached is not None:
+                yield cached
+                return
+        advice = None
+        for advice in stream_user_message(agent_id, ADVICE_PROMPT, detailed):
+            yield advice
+        if cache is not None:
+            cache.put(_advice_cache_key(agent_id, detailed), advice)
+    else:
+        yield "Error: User agent not found"
+
+def stream_user_message(agent_id, message, detailed=False, poll_interval=0.05):
+    # Yields the formatted response so far while the agent is still stepping.
+    # The worker holds the shared client's run lock for the whole run, and
+    # its interface buffer is only read until the worker marks the run
+    # finished, so every buffer read belongs to this run. Progress is read
+    # without draining it, so the final response is unaffected.
+    outcome = {}
+    started = threading.Event()
+    reading = threading.Lock()
+
+    def run():
+        try:
+            with agent_client() as client:
+                interface = getattr(client, 'interface', None)
+                # Left over from the previous run, so never read
+                outcome['interface'], outcome['stale'] = interface, getattr(interface, 'buffer', None)
+                started.set()
+                try:
+                    outcome['response'] = client.user_message(agent_id=agent_id, message=message)
+                finally:
+                    with reading:
+                        outcome['finished'] = True
+        except Exception as e:
+            outcome['error'] = e
+        finally:
+            started.set()
+
+    # The worker releases the lock only once the run is over, even if the
+    # caller stops reading early
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    started.wait()
+
+    interface = outcome.get('interface')
+    buffer = None
+    seen = 0
+    lines = []
+    while worker.is_alive():
+        worker.join(poll_interval)
+        with reading:
+            if outcome.get('finished'):
+                break
+            current = getattr(interface, 'buffer', None)
+            if current is None or current is outcome.get('stale'):
+                continue
+            if current is not buffer:
+                buffer, seen = current, 0
+            events = list(buffer.queue)[seen:]
+        seen += len(events)
+        new_lines = [line for line in (format_stream_event(event, detailed) for event in events) if line]
+        if new_lines:
+            lines.extend(new_lines)
+            yield "\n".join(lines)
+
+    worker.join()
+    invalidate_agent_snapshot(agent_id)
+    if 'error' in outcome:
+        raise outcome['error']
+    yield process_agent_messages(outcome['response'].messages, detailed)
+
+def format_stream_event(event, detailed=False):
+    if isinstance(event, tuple):
+        event = event[0]
+    if not isinstance(event, dict):
+        return None
+    if 'assistant_message' in event:
+        return f"🤖 Agent: {event['assistant_message']}"
+    if not detailed:
+        return None
+    if 'internal_monologue' in event:
+        return f"💭 Inner Monologue: {event['internal_monologue']}"
+    if 'function_call' in event and not event['function_call'].startswith('send_message('):
+        return f"🛠️ Function Call: {event['function_call']}"
+    if 'function_return' in event:
+        return f"📊 Function Return: {event['function_return']}"
+    return None
+
 def process_agent_messages(messages, detailed=False):
     result = []
     agent_responses = []
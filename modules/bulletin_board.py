@@ -1,88 +1,124 @@
-from modules.user_management import get_group_members, get_comprehensive_agent_data, letta_client
+from modules.user_management import get_group_members
 from modules.group_data_storage import save_group_data, load_group_data
-from datetime import datetime, timedelta
-from letta.schemas.message import MessageRole
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
+from modules.group_context import get_group_snapshots, decode_message, format_entry
+from modules.llm_cache import cached_chat_completion
+from modules.prompt_builder import PromptBuilder
+from modules.group_summaries import use_map_reduce, summarize_members
+from modules.coalescing import artifact_flights
+from modules.passage_index import rank_passages
+from modules.tracing import traced
 
-# Load environment variables from .env file
-load_dotenv()
+BULLETIN_MEMBER_FOCUS = "This summary will feed a family bulletin board of recent news, plans and highlights."
+BULLETIN_PASSAGE_QUERY = "Recent news, plans, events and highlights worth sharing with family and friends."
+BULLETIN_MAX_PASSAGES = 16
 
-def create_or_update_group_bulletin(group_name, group_agent_id, new_item=None):
+def _latest(items):
+    latest = max(items, key=lambda item: item.created_at)
+    return latest.id, latest.created_at.isoformat()
+
+def _newer_than(items, timestamp):
+    if not timestamp:
+        return items
+    return [item for item in items if item.created_at.isoformat() > timestamp]
+
+def _add_activity(section, agent_id, messages, passages):
+    # Oldest first, so the token budget trims the oldest content first
+    section.add_part("Recent messages:", (
+        format_entry(speaker, time, text)
+        for message in messages[::-1]
+        for speaker, time, text in decode_message(message)
+    ))
+    # A fixed number of passages, the most relevant ones if the index can rank them
+    relevant = rank_passages(agent_id, passages, BULLETIN_PASSAGE_QUERY, BULLETIN_MAX_PASSAGES)
+    if relevant is None:
+        relevant = passages[:BULLETIN_MAX_PASSAGES]
+    section.add_part("Relevant archival memories:", (f"- {passage.text}" for passage in relevant[::-1]))
+
+def create_or_update_group_bulletin(group_name, group_agent_id, new_item=None, use_cache=True):
+    # Concurrent refreshes of one group share a single regeneration, and items
+    # posted while one is running are batched into the next
+    return artifact_flights.run(
+        (group_name, "bulletin"),
+        lambda new_items: _regenerate_bulletin(group_name, group_agent_id, new_items, use_cache),
+        new_item,
+    )
+
+@traced("bulletin.regenerate")
+def _regenerate_bulletin(group_name, group_agent_id, new_items, use_cache):
     members = get_group_members(group_name)
-    bulletin_content = f"Group Bulletin Board for {group_name}\n\n"
+    map_reduce = use_map_reduce(members)
+    prompt = PromptBuilder()
+    prompt.add(f"Group Bulletin Board for {group_name}\n")
 
-    # Load existing bulletin
+    # Load existing bulletin and the per-member cursors it was built from
     existing_bulletin = load_group_data(group_name, "bulletin")
+    cursors = {}
     if existing_bulletin:
-        bulletin_content += "Existing bulletin content:\n" + existing_bulletin + "\n\n"
+        cursors = load_group_data(group_name, "bulletin_cursors") or {}
+        prompt.add("Existing bulletin content:\n" + existing_bulletin + "\n")
 
-    # Get data for the last 7 days
-    # TODO: Fix function calls to get proper date range
-    # end_date = datetime.now()
-    # start_date = end_date - timedelta(days=7)
-    end_date = None
-    start_date = None
+    # Shared with the todo list; a member whose fetch timed out simply shows no new activity
+    snapshots = get_group_snapshots(members)
 
+    new_cursors = {}
+    has_activity = False
     for username, agent_id in members.items():
-        agent_data = get_comprehensive_agent_data(agent_id, start_date, end_date)
-        
-        bulletin_content += f"User: {username}\n"
-        
-        # TODO: Fix in-context memory retrieval
-        # bulletin_content += f"In-context memory: {agent_data['memory_summaries']['in_context_memory'].memory['human']}...\n"
-        
-        # TODO: Investigate why archival_memory_summary is not returning data
-        # bulletin_content += f"Archival memory: {agent_data['memory_summaries']['archival_memory_summary'].total_passages} passages\n"
-        
-        # TODO: Find a way to access recall memory content
-        # bulletin_content += f"Recall memory: {agent_data['memory_summaries']['recall_memory_summary'].total_messages} messages\n"
-        
-        bulletin_content += f"Recent messages: {len(agent_data['messages'])}\n"
-        bulletin_content += f"Recent archival memory passages: {len(agent_data['archival_memory_passages'])}\n"
-        
-        # Process messages
-        bulletin_content += "Recent messages:\n"
-        for message in agent_data['messages'][::-1]:
-            if message.role == MessageRole.user:
-                message_data = json.loads(message.text)
-                if message_data['type'] == 'user_message':
-                    bulletin_content += f"User ({message_data['time']}): {message_data['message']}\n"
-            elif message.role == MessageRole.assistant:
-                for tool_call in message.tool_calls:
-                    if tool_call.function.name == 'send_message':
-                        tool_call_data = json.loads(tool_call.function.arguments)
-                        bulletin_content += f"Assistant: {tool_call_data['message']}\n"
-        
-        bulletin_content += "\n"
-        
-        # Add recent archival memory passages
-        if agent_data['archival_memory_passages']:
-            bulletin_content += "Recent archival memories:\n"
-            for passage in agent_data['archival_memory_passages'][:16]:  # Limit to 16 most recent passages
-                bulletin_content += f"- {passage.text}\n" 
-        
-        bulletin_content += "\n"
-
-    if new_item:
-        bulletin_content += f"\nNew item to be added: {new_item}\n"
+        cursor = cursors.get(agent_id, {})
+        messages = _newer_than(snapshots[username]['messages'], cursor.get('message_at'))
+        passages = _newer_than(snapshots[username]['archival_memory_passages'], cursor.get('passage_at'))
+
+        new_cursor = dict(cursor)
+        if messages:
+            new_cursor['message_id'], new_cursor['message_at'] = _latest(messages)
+        if passages:
+            new_cursor['passage_id'], new_cursor['passage_at'] = _latest(passages)
+        new_cursors[agent_id] = new_cursor
+
+        if not messages and not passages:
+            continue
+        has_activity = True
+
+        if not map_reduce:
+            section = prompt.section(
+                f"User: {username}\n"
+                f"New messages since last update: {len(messages)}\n"
+                f"New archival memory passages since last update: {len(passages)}"
+            )
+            _add_activity(section, agent_id, messages, passages)
+
+    # Nothing happened since the last bulletin, so there is nothing for the LLM to do
+    if existing_bulletin and not has_activity and not new_items:
+        return existing_bulletin
+
+    if map_reduce:
+        # Large groups: merge cached per-member summaries instead of raw history
+        summaries = summarize_members(
+            group_name, "bulletin", members, snapshots, BULLETIN_MEMBER_FOCUS,
+            lambda section, agent_id, agent_data: _add_activity(
+                section, agent_id, agent_data['messages'], agent_data['archival_memory_passages']
+            ),
+        )
+        for username, summary in summaries.items():
+            prompt.section(f"User: {username}").add_part("Summary of recent activity:", [summary])
+
+    if len(new_items) == 1:
+        prompt.add(f"New item to be added: {new_items[0]}\n")
+    elif new_items:
+        prompt.add("New items to be added:\n" + "\n".join(f"- {item}" for item in new_items) + "\n")
+
+    bulletin_content = prompt.build()
 
     # Use OpenAI's GPT-4o-mini to update the bulletin board
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant tasked with updating a concise and informative bulletin board for a group."},
-            {"role": "user", "content": f"Based on the following information about group members, existing bulletin content, and any new item, update the bulletin board for the group. Follow these guidelines:\n\n1. Limit to 2 items per user\n2. Balance the content between users so that they get roughly equal amounts of items\n3. If there's a new item, make sure to incorporate it prominently\n4. Prioritize recent and important information\n5. Only add or remove items if necessary based on the recent information\n6. Use emojis to make the content more engaging\n7. Use a single newline character to separate each user's content\n8. Return just the content, with no other text\n\nHere's the content to work with:\n\n{bulletin_content}"}
-        ]
+    updated_bulletin = cached_chat_completion(
+        "gpt-4o-mini",
+        "You are a helpful assistant tasked with updating a concise and informative bulletin board for a group.",
+        f"Based on the following information about group members, existing bulletin content, and any new item, update the bulletin board for the group. Follow these guidelines:\n\n1. Limit to 2 items per user\n2. Balance the content between users so that they get roughly equal amounts of items\n3. If there's a new item, make sure to incorporate it prominently\n4. Prioritize recent and important information\n5. Only add or remove items if necessary based on the recent information\n6. Use emojis to make the content more engaging\n7. Use a single newline character to separate each user's content\n8. Return just the content, with no other text\n\nHere's the content to work with:\n\n{bulletin_content}",
+        use_cache=use_cache,
     )
 
-    updated_bulletin = response.choices[0].message.content
-
-    # Save the updated bulletin
+    # Save the updated bulletin along with how far into each member's history it has read
     save_group_data(group_name, "bulletin", updated_bulletin)
+    save_group_data(group_name, "bulletin_cursors", new_cursors)
 
     return updated_bulletin
 
@@ -0,0 +1,221 @@
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from modules.prompt_builder import count_tokens
+from modules.tracing import span
+
+GOVERNOR_ENABLED = os.getenv("WIS_GOVERNOR_ENABLED", "1") != "0"
+GOVERNOR_RETRIES = int(os.getenv("WIS_GOVERNOR_RETRIES", "4"))
+GOVERNOR_BACKOFF_BASE = float(os.getenv("WIS_GOVERNOR_BACKOFF_BASE", "0.5"))
+GOVERNOR_BACKOFF_MAX = float(os.getenv("WIS_GOVERNOR_BACKOFF_MAX", "30"))
+GOVERNOR_INITIAL_CONCURRENCY = int(os.getenv("WIS_GOVERNOR_INITIAL_CONCURRENCY", "8"))
+GOVERNOR_MAX_CONCURRENCY = int(os.getenv("WIS_GOVERNOR_MAX_CONCURRENCY", "32"))
+DEFAULT_COMPLETION_TOKENS = 500
+
+# Requests and tokens per minute for "provider:model", with "provider" as the
+# fallback for any other model. Each model gets its own buckets, as providers
+# meter them separately. Override with WIS_RATE_LIMITS, e.g.
+# '{"openai:gpt-4o-mini": {"rpm": 5000, "tpm": 2000000}}'.
+RATE_LIMITS = {
+    "openai": {'rpm': 500, 'tpm': 200000},
+    "openai:whisper-1": {'rpm': 50},
+    "openai:text-embedding-3-small": {'rpm': 3000, 'tpm': 1000000},
+    "anthropic": {'rpm': 50, 'tpm': 40000},
+}
+RATE_LIMITS.update(json.loads(os.getenv("WIS_RATE_LIMITS", "{}")))
+
+# Lower values are admitted first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar("wis_call_priority", default=INTERACTIVE)
+
+@contextmanager
+def call_priority(priority):
+    # Applies to governed calls made in this context; thread pools need the context copied over
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def background_priority():
+    return call_priority(BACKGROUND)
+
+def current_priority():
+    return _priority.get()
+
+def estimate_tokens(*texts, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    return sum(count_tokens(text) for text in texts) + completion_tokens
+
+class TokenBucket:
+    """Refills continuously at ``per_minute / 60`` per second, holding at most a minute's worth."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        # May go negative when a response reports more usage than was estimated
+        self.level = min(self.capacity, self.level - min(amount, self.capacity))
+
+class CallGovernor:
+    """Admits calls to one provider model.
+
+    Callers wait in a priority queue, interactive before background and in
+    arrival order within a priority, until the request and token buckets
+    allow the call and fewer than ``limit`` calls are in flight. The limit
+    adapts: it grows by one for every ``limit`` successful calls and halves
+    on a rate-limit response, which also pauses admissions for the
+    provider's Retry-After delay.
+    """
+
+    def __init__(self, rpm=None, tpm=None, initial_concurrency=GOVERNOR_INITIAL_CONCURRENCY,
+                 max_concurrency=GOVERNOR_MAX_CONCURRENCY):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._order = itertools.count()
+
+    def _wait_time(self, tokens, now):
+        waits = [self.paused_until - now]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def acquire(self, tokens=0, priority=INTERACTIVE):
+        ticket = (priority, next(self._order))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            # A new head of the queue must get a chance to go first
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._queue[0] == ticket and self.in_flight < int(self.limit):
+                        delay = self._wait_time(tokens, time.monotonic())
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self.in_flight += 1
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self._cond.notify_all()
+
+    def release(self, succeeded, throttled=False, retry_after=None, token_correction=0):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + (retry_after or GOVERNOR_BACKOFF_BASE))
+            elif succeeded:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            if self.tokens and token_correction:
+                self.tokens.take(token_correction)
+            self._cond.notify_all()
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(provider, model):
+    key = f"{provider}:{model}"
+    with _governors_lock:
+        governor = _governors.get(key)
+        if governor is None:
+            limits = RATE_LIMITS.get(key) or RATE_LIMITS.get(provider) or {}
+            governor = _governors[key] = CallGovernor(limits.get('rpm'), limits.get('tpm'))
+        return governor
+
+def is_rate_limited(error):
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == "RateLimitError"
+
+def is_retryable(error):
+    # Both SDKs expose status_code on HTTP errors and use these names for transport failures
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in ("APITimeoutError", "APIConnectionError")
+
+def retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+def backoff_delay(attempt, delay=None):
+    # Full jitter, so callers throttled together do not retry together
+    if delay is not None:
+        return delay + random.uniform(0, GOVERNOR_BACKOFF_BASE)
+    return random.uniform(0, min(GOVERNOR_BACKOFF_MAX, GOVERNOR_BACKOFF_BASE * 2 ** attempt))
+
+def _reported_tokens(result):
+    usage = getattr(result, 'usage', None)
+    counts = [getattr(usage, name, None) for name in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens")]
+    counts = [count for count in counts if isinstance(count, int)]
+    return sum(counts) if counts else None
+
+def governed_call(provider, model, fn, tokens=0):
+    """Run ``fn()`` once the governor for ``provider``/``model`` admits it.
+
+    ``tokens`` is the estimated prompt plus completion size. It is charged
+    up front and corrected once the response reports its usage. Rate
+    limits, timeouts and server errors are retried with jittered
+    exponential backoff up to GOVERNOR_RETRIES times, then re-raised.
+    """
+    if not GOVERNOR_ENABLED:
+        return fn()
+    governor = get_governor(provider, model)
+    priority = current_priority()
+    with span("governor.call", provider=provider, model=model, background=priority == BACKGROUND) as current:
+        waited = 0.0
+        for attempt in itertools.count():
+            started = time.monotonic()
+            governor.acquire(tokens, priority)
+            waited += time.monotonic() - started
+            current.set(wait_ms=round(waited * 1000, 3), retries=attempt)
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                delay = retry_after(e)
+                governor.release(False, throttled, delay)
+                if attempt >= GOVERNOR_RETRIES or not (throttled or is_retryable(e)):
+                    raise
+                time.sleep(backoff_delay(attempt, delay))
+                continue
+            used = _reported_tokens(result)
+            governor.release(True, token_correction=used - tokens if used is not None else 0)
+            return result
@@ -0,0 +1,82 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from modules.tracing import trace_client
+from modules.call_governor import CallGovernor, current_priority
+
+# Load environment variables
+load_dotenv()
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("WIS_HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("WIS_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("WIS_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Attributes that lead to traced methods, e.g. client.chat.completions.create
+TRACED_NAMESPACES = {
+    "openai": ("chat", "completions", "audio", "transcriptions", "embeddings"),
+    "anthropic": ("messages",),
+    "letta": (),
+}
+
+# One lazily created client per provider for the whole process. SDK imports
+# happen on first use so importing the app does not pay for them up front.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = trace_client(factory(), name, TRACED_NAMESPACES.get(name, ()))
+    return client
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+# Retries are left to modules.call_governor, which backs off across all callers of a model
+def _create_openai_client():
+    from openai import OpenAI, DefaultHttpxClient
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=DefaultHttpxClient(limits=_http_limits()), max_retries=0)
+
+def _create_anthropic_client():
+    from anthropic import Anthropic, DefaultHttpxClient
+    return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), http_client=DefaultHttpxClient(limits=_http_limits()), max_retries=0)
+
+def _create_letta_client():
+    from letta import create_client
+    return create_client()
+
+def get_openai_client():
+    return _get_or_create("openai", _create_openai_client)
+
+def get_anthropic_client():
+    return _get_or_create("anthropic", _create_anthropic_client)
+
+def get_letta_client():
+    return _get_or_create("letta", _create_letta_client)
+
+def set_client(name, client):
+    # Swap in a different client, e.g. a local stand-in for benchmarks
+    with _clients_lock:
+        _clients[name] = trace_client(client, name, TRACED_NAMESPACES.get(name, ()))
+
+# letta's client resets its queuing interface on every call and builds the
+# user_message response from it, so agent runs take turns on the shared client,
+# interactive runs ahead of background ones
+_agent_runs = CallGovernor(initial_concurrency=1, max_concurrency=1)
+
+@contextmanager
+def agent_client():
+    _agent_runs.acquire(priority=current_priority())
+    try:
+        yield get_letta_client()
+    finally:
+        _agent_runs.release(True)
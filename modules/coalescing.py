@@ -0,0 +1,71 @@
+import contextvars
+import threading
+from concurrent.futures import Future
+
+class _Flight:
+    def __init__(self):
+        self.running = None
+        self.queued = None
+        self.compute = None
+        self.context = None
+        self.items = []
+
+class SingleFlight:
+    """Coalesces concurrent regenerations of the same key.
+
+    At most one computation per key runs at a time, so its writes never race.
+    Callers without an item join the computation already in flight. Callers
+    with an item cannot, since it started without their item; they join the
+    next run instead, which receives every item queued in the meantime as one
+    batch.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key, compute, item=None):
+        # compute(items) receives the list of batched items, possibly empty
+        with self._lock:
+            flight = self._flights.setdefault(key, _Flight())
+            if item is None and flight.running is not None:
+                return_future = flight.running
+                job = None
+            else:
+                if item is not None:
+                    flight.items.append(item)
+                if flight.queued is None:
+                    flight.queued = Future()
+                    flight.compute = compute
+                    flight.context = contextvars.copy_context()
+                return_future = flight.queued
+                job = self._start_next(flight)
+
+        if job is not None:
+            self._execute(key, flight, *job)
+        return return_future.result()
+
+    def _start_next(self, flight):
+        # Called with the lock held
+        if flight.running is not None or flight.queued is None:
+            return None
+        flight.running, flight.queued = flight.queued, None
+        items, flight.items = flight.items, []
+        return flight.compute, items, flight.running, flight.context
+
+    def _execute(self, key, flight, compute, items, future, context):
+        try:
+            # In the context of whoever queued the run, so settings like call priority carry over
+            future.set_result(context.run(compute, items))
+        except BaseException as e:
+            future.set_exception(e)
+        with self._lock:
+            flight.running = None
+            job = self._start_next(flight)
+            if job is None and flight.queued is None:
+                del self._flights[key]
+        if job is not None:
+            # Waiters for the next run are blocked on their future; run it for them
+            threading.Thread(target=self._execute, args=(key, flight, *job), daemon=True).start()
+
+artifact_flights = SingleFlight()
@@ -0,0 +1,294 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules.clients import get_letta_client
+from modules.tracing import span
+from letta.schemas.message import MessageRole
+from modules.user_management import (
+    get_messages_after, get_archival_memory_after, iter_messages, iter_archival_memory, as_utc,
+)
+
+AGENT_DATA_MAX_WORKERS = int(os.getenv("WIS_AGENT_DATA_MAX_WORKERS", "16"))
+AGENT_DATA_CALL_TIMEOUT = float(os.getenv("WIS_AGENT_DATA_CALL_TIMEOUT", "20"))
+SNAPSHOT_TTL = float(os.getenv("WIS_SNAPSHOT_TTL", "60"))
+SNAPSHOT_CACHE_SIZE = int(os.getenv("WIS_SNAPSHOT_CACHE_SIZE", "256"))
+SNAPSHOT_MAX_ITEMS = 1000
+SNAPSHOT_WINDOW_DAYS = float(os.getenv("WIS_SNAPSHOT_WINDOW_DAYS", "7"))
+DECODED_MESSAGE_CACHE_SIZE = int(os.getenv("WIS_DECODED_MESSAGE_CACHE_SIZE", "50000"))
+
+# Shared by every collection so the total number of in-flight letta calls stays bounded
+_executor = ThreadPoolExecutor(max_workers=AGENT_DATA_MAX_WORKERS, thread_name_prefix="agent-data")
+
+class _Call:
+    def __init__(self, fn):
+        self.fn = fn
+        self.started_at = None
+
+    def __call__(self):
+        self.started_at = time.monotonic()
+        return self.fn()
+
+def iter_completed(jobs, timeout=AGENT_DATA_CALL_TIMEOUT, executor=None):
+    """Run ``jobs`` (key -> ``fn()``) concurrently and yield ``(key, result, error)`` as each finishes.
+
+    The timeout applies per job from the moment it starts running, so jobs
+    waiting for a free worker are not charged for the wait. A job that times
+    out yields a TimeoutError; its worker thread cannot be interrupted and its
+    eventual result is discarded. Jobs still queued when the caller stops
+    iterating are cancelled.
+    """
+    executor = executor or _executor
+    pending = {}
+    for key, fn in jobs.items():
+        call = _Call(fn)
+        pending[executor.submit(call)] = (key, call)
+
+    try:
+        while pending:
+            deadlines = [call.started_at + timeout for _, call in pending.values() if call.started_at is not None]
+            wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else 0.05
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                key, _ = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield key, None, e
+                else:
+                    yield key, result, None
+
+            now = time.monotonic()
+            for future, (key, call) in list(pending.items()):
+                if call.started_at is not None and now - call.started_at > timeout:
+                    future.cancel()
+                    del pending[future]
+                    yield key, None, TimeoutError(f"no result after {timeout:g}s")
+    finally:
+        for future in pending:
+            future.cancel()
+
+def collect_agent_data(members, calls, timeout=AGENT_DATA_CALL_TIMEOUT, defaults=None):
+    """Run every call for every member concurrently on the shared pool.
+
+    ``members`` maps usernames to agent ids and ``calls`` maps field names to
+    ``fn(agent_id)``. The timeout applies per call from the moment it starts
+    running; calls that time out or raise fall back to ``defaults[field]``
+    (``None`` by default) and are listed under the member's ``'incomplete'``
+    key, so one slow agent cannot hold up the whole group.
+    """
+    defaults = defaults or {}
+    results = {
+        username: {field: defaults.get(field) for field in calls} | {'incomplete': []}
+        for username in members
+    }
+    jobs = {
+        (username, field): partial(fn, agent_id)
+        for username, agent_id in members.items()
+        for field, fn in calls.items()
+    }
+    for (username, field), result, error in iter_completed(jobs, timeout):
+        if error is None:
+            results[username][field] = result
+        else:
+            results[username]['incomplete'].append(field)
+    return results
+
+class SnapshotCache:
+    """TTL + LRU cache of per-agent snapshots.
+
+    Expired or invalidated snapshots are kept (until evicted) as the base for
+    an incremental refresh that only fetches items newer than what they hold.
+    """
+
+    def __init__(self, ttl=SNAPSHOT_TTL, max_size=SNAPSHOT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._invalidated_at = {}
+
+    def _lookup(self, agent_id):
+        entry = self._entries.get(agent_id)
+        if entry is None:
+            return None, None
+        self._entries.move_to_end(agent_id)
+        fetched_at, snapshot = entry
+        fresh = fetched_at is not None and time.monotonic() - fetched_at < self.ttl
+        return snapshot, fresh
+
+    def _store(self, agent_id, snapshot, fresh, fetch_started):
+        # A message posted while the fetch was running makes its result stale on arrival
+        if self._invalidated_at.pop(agent_id, float("-inf")) >= fetch_started:
+            fresh = False
+        self._entries[agent_id] = (time.monotonic() if fresh else None, snapshot)
+        self._entries.move_to_end(agent_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, agent_id):
+        with self.lock:
+            entry = self._entries.get(agent_id)
+            if entry is not None:
+                self._entries[agent_id] = (None, entry[1])
+            if agent_id in self._inflight:
+                self._invalidated_at[agent_id] = time.monotonic()
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._invalidated_at.clear()
+
+    def get_many(self, members, timeout=AGENT_DATA_CALL_TIMEOUT):
+        results = {}
+        to_fetch = {}
+        bases = {}
+        owned = {}
+        waiting = {}
+        with self.lock:
+            for username, agent_id in members.items():
+                snapshot, fresh = self._lookup(agent_id)
+                if fresh:
+                    results[username] = snapshot
+                elif agent_id in self._inflight:
+                    # Someone else is already refreshing this agent; share their result
+                    waiting[username] = self._inflight[agent_id]
+                else:
+                    owned[agent_id] = self._inflight[agent_id] = Future()
+                    to_fetch[username] = agent_id
+                    bases[agent_id] = snapshot
+
+        fetch_started = time.monotonic()
+        try:
+            fetched = _fetch_snapshots(to_fetch, bases, timeout)
+            with self.lock:
+                for username, agent_id in to_fetch.items():
+                    snapshot = fetched[username]
+                    self._store(agent_id, snapshot, not snapshot['incomplete'], fetch_started)
+                    owned[agent_id].set_result(snapshot)
+                    results[username] = snapshot
+        except BaseException as e:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                for agent_id in owned:
+                    self._inflight.pop(agent_id, None)
+
+        for username, future in waiting.items():
+            results[username] = future.result()
+        return {username: results[username] for username in members}
+
+def window_start():
+    return datetime.now(timezone.utc) - timedelta(days=SNAPSHOT_WINDOW_DAYS)
+
+def _merge_newest(new_items, base_items):
+    # Newest first, de-duplicated by id and bounded like a fresh fetch, so items age out of the window
+    start = window_start()
+    merged = {item.id: item for item in base_items}
+    merged.update((item.id, item) for item in new_items)
+    recent = [item for item in merged.values() if as_utc(item.created_at) >= start]
+    return sorted(recent, key=lambda item: item.created_at, reverse=True)[:SNAPSHOT_MAX_ITEMS]
+
+def _fetch_recent(iter_items, get_after, agent_id, newest_id):
+    if newest_id is None:
+        # First fetch: page back through the window only, never the whole history
+        return list(islice(iter_items(agent_id, start_date=window_start()), SNAPSHOT_MAX_ITEMS))
+    return get_after(agent_id, newest_id, limit=SNAPSHOT_MAX_ITEMS)
+
+def _fetch_snapshots(members, bases, timeout):
+    def newest_id(agent_id, field):
+        base = bases.get(agent_id)
+        if not base or not base[field]:
+            return None
+        return max(base[field], key=lambda item: item.created_at).id
+
+    collected = collect_agent_data(
+        members,
+        {
+            'in_context_memory': lambda agent_id: get_letta_client().get_in_context_memory(agent_id),
+            'archival_memory_summary': lambda agent_id: get_letta_client().get_archival_memory_summary(agent_id),
+            'recall_memory_summary': lambda agent_id: get_letta_client().get_recall_memory_summary(agent_id),
+            'messages': lambda agent_id: _fetch_recent(
+                iter_messages, get_messages_after, agent_id, newest_id(agent_id, 'messages')
+            ),
+            'archival_memory_passages': lambda agent_id: _fetch_recent(
+                iter_archival_memory, get_archival_memory_after, agent_id, newest_id(agent_id, 'archival_memory_passages')
+            ),
+        },
+        timeout=timeout,
+        defaults={'messages': [], 'archival_memory_passages': []},
+    )
+    snapshots = {}
+    for username, data in collected.items():
+        base = bases.get(members[username]) or {'messages': [], 'archival_memory_passages': []}
+        # Same shape as get_comprehensive_agent_data
+        snapshots[username] = {
+            'memory_summaries': {
+                'in_context_memory': data['in_context_memory'],
+                'archival_memory_summary': data['archival_memory_summary'],
+                'recall_memory_summary': data['recall_memory_summary']
+            },
+            'messages': _merge_newest(data['messages'], base['messages']),
+            'archival_memory_passages': _merge_newest(data['archival_memory_passages'], base['archival_memory_passages']),
+            'incomplete': data['incomplete']
+        }
+    return snapshots
+
+snapshot_cache = SnapshotCache()
+
+def get_group_snapshots(members, timeout=AGENT_DATA_CALL_TIMEOUT):
+    with span("agent_data.group_snapshots", members=len(members)):
+        return snapshot_cache.get_many(members, timeout)
+
+def invalidate_agent_snapshot(agent_id):
+    snapshot_cache.invalidate(agent_id)
+
+_decoded_messages = OrderedDict()
+_decoded_messages_lock = threading.Lock()
+
+def decode_message(message):
+    """Return the human-readable entries of a letta message as (speaker, time, text) tuples.
+
+    Messages never change once written, so each one is JSON-decoded only once
+    per process no matter how many snapshots or artifacts read it.
+    """
+    with _decoded_messages_lock:
+        entries = _decoded_messages.get(message.id)
+        if entries is not None:
+            _decoded_messages.move_to_end(message.id)
+            return entries
+
+    entries = ()
+    try:
+        if message.role == MessageRole.user:
+            message_data = json.loads(message.text)
+            if message_data['type'] == 'user_message':
+                entries = (("User", message_data.get('time'), message_data['message']),)
+        elif message.role == MessageRole.assistant:
+            entries = tuple(
+                ("Assistant", None, json.loads(tool_call.function.arguments)['message'])
+                for tool_call in message.tool_calls or []
+                if tool_call.function.name == 'send_message'
+            )
+    except (ValueError, KeyError, TypeError):
+        # Heartbeats, system alerts and malformed payloads carry nothing worth summarizing
+        entries = ()
+
+    with _decoded_messages_lock:
+        _decoded_messages[message.id] = entries
+        while len(_decoded_messages) > DECODED_MESSAGE_CACHE_SIZE:
+            _decoded_messages.popitem(last=False)
+    return entries
+
+def format_entry(speaker, time, text):
+    return f"{speaker} ({time}): {text}" if time else f"{speaker}: {text}"
@@ -0,0 +1,91 @@
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from modules.llm_cache import cached_chat_completion
+from modules.group_data_storage import save_group_data, load_group_data
+from modules.prompt_builder import PromptBuilder
+
+# "direct" sends every member's raw history in one call, "map_reduce" summarizes
+# members separately first, "auto" switches to map-reduce for larger groups
+GROUP_SUMMARY_MODE = os.getenv("WIS_GROUP_SUMMARY_MODE", "auto")
+MAP_REDUCE_MIN_MEMBERS = int(os.getenv("WIS_MAP_REDUCE_MIN_MEMBERS", "8"))
+MEMBER_SUMMARY_MAX_WORKERS = int(os.getenv("WIS_MEMBER_SUMMARY_MAX_WORKERS", "8"))
+MEMBER_SUMMARY_TOKEN_BUDGET = int(os.getenv("WIS_MEMBER_SUMMARY_TOKEN_BUDGET", "4000"))
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=MEMBER_SUMMARY_MAX_WORKERS, thread_name_prefix="member-summary")
+
+def use_map_reduce(members):
+    if GROUP_SUMMARY_MODE == "map_reduce":
+        return True
+    if GROUP_SUMMARY_MODE == "direct":
+        return False
+    return len(members) >= MAP_REDUCE_MIN_MEMBERS
+
+def _newest_id(items):
+    return max(items, key=lambda item: item.created_at).id if items else None
+
+def activity_marker(agent_data):
+    # Changes whenever the member has a new message or archival passage
+    return [_newest_id(agent_data['messages']), _newest_id(agent_data['archival_memory_passages'])]
+
+def _summarize_member(username, agent_id, agent_data, focus, render_member):
+    prompt = PromptBuilder(MEMBER_SUMMARY_TOKEN_BUDGET)
+    render_member(prompt.section(f"User: {username}"), agent_id, agent_data)
+    member_content = prompt.build()
+    return cached_chat_completion(
+        "gpt-4o-mini",
+        "You are a helpful assistant that condenses one group member's recent activity into a short factual summary.",
+        f"{focus} Summarize the following in at most 5 short bullet points. Keep names, dates and commitments. Return just the bullet points, with no other text:\n\n{member_content}",
+        max_tokens=300,
+    )
+
+def summarize_members(group_name, artifact, members, snapshots, focus, render_member):
+    """Map step: one short summary per member, computed in parallel.
+
+    Summaries are persisted per artifact and reused until the member has new
+    activity, so a refresh only pays for members whose history changed.
+    ``render_member(section, agent_id, agent_data)`` adds the member's raw
+    context to a PromptSection. A member whose summary fails keeps their
+    previous one, or is left out if there is none.
+    """
+    cache_key = f"{artifact}_member_summaries"
+    cached = load_group_data(group_name, cache_key) or {}
+
+    summaries = {}
+    pending = {}
+    for username, agent_id in members.items():
+        agent_data = snapshots[username]
+        marker = activity_marker(agent_data)
+        entry = cached.get(agent_id)
+        if entry is not None and entry['marker'] == marker:
+            summaries[username] = entry['summary']
+        elif agent_data['incomplete'] and entry is not None:
+            # Don't replace a good summary with one built from a partial fetch
+            summaries[username] = entry['summary']
+        else:
+            # Copy the context so member summaries keep the caller's call priority
+            pending[username] = (marker, _executor.submit(
+                contextvars.copy_context().run, _summarize_member, username, agent_id, agent_data, focus, render_member
+            ))
+
+    updated = False
+    for username, (marker, future) in pending.items():
+        agent_id = members[username]
+        try:
+            summary = future.result()
+        except Exception:
+            # Fall back to the member's previous summary, or leave them out this time
+            logger.warning("Could not summarize %s for the %s of group %s", username, artifact, group_name, exc_info=True)
+            if agent_id in cached:
+                summaries[username] = cached[agent_id]['summary']
+            continue
+        summaries[username] = summary
+        cached[agent_id] = {'marker': marker, 'summary': summary}
+        updated = True
+
+    if updated:
+        save_group_data(group_name, cache_key, cached)
+    return {username: summaries[username] for username in members if username in summaries}
@@ -1,18 +1,23 @@
+import io
 import os
-import uuid
 import base64
+import hashlib
 from pathlib import Path
-from openai import OpenAI
-from anthropic import Anthropic
-from dotenv import load_dotenv
+from PIL import Image, ImageOps
+from modules.clients import get_openai_client, get_anthropic_client
+from modules.call_governor import governed_call
+from modules.storage import atomic_write_bytes
+from modules.tracing import traced, annotate
 import mimetypes
 
-# Load environment variables
-load_dotenv()
+SUPPORTED_MODELS = ["gpt-4o-mini", "gpt-4o", "claude-3-5-sonnet-20240620"]
 
-# Initialize clients
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# Vision models downsample large images anyway, so don't pay to upload the extra pixels
+IMAGE_MAX_EDGE = int(os.getenv("WIS_IMAGE_MAX_EDGE", "1568"))
+IMAGE_FORMAT = os.getenv("WIS_IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("WIS_IMAGE_QUALITY", "85"))
+# A downscaled image plus the 512-token reply, charged against the token rate limit
+IMAGE_TOKEN_ESTIMATE = 2100
 
 # Define storage directories
 IMAGE_DIR = Path("stored_images")
@@ -26,47 +31,84 @@ def get_mime_type(file_path):
     mime_type, _ = mimetypes.guess_type(file_path)
     return mime_type or "application/octet-stream"
 
+def prepare_image_for_vision(image_data, mime_type, max_edge=IMAGE_MAX_EDGE, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    # Decode, apply the EXIF orientation, downscale and re-encode. Metadata is
+    # dropped because it is not passed to save(). Anything Pillow cannot
+    # decode is sent unchanged.
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            if image_format == "JPEG" and image.mode != "RGB":
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                else:
+                    image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format=image_format, quality=quality, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return image_data, mime_type
+    return output.getvalue(), Image.MIME[image_format]
+
+@traced("image.summarize")
 def summarize_image(image_path, model="gpt-4o-mini"):
-    # Generate a unique ID for the image
-    image_id = str(uuid.uuid4())
-    
+    if model not in SUPPORTED_MODELS:
+        raise ValueError("Unsupported model. Choose 'gpt-4o-mini', 'gpt-4o', or 'claude-3-5-sonnet-20240620'.")
+
     # Read the image file
     with open(image_path, "rb") as image_file:
         image_data = image_file.read()
-    
+
+    # Images are content-addressed, so re-uploads map to the same ID, file and summaries
+    image_id = hashlib.sha256(image_data).hexdigest()
+
+    # Save the image to the file system unless we already have these bytes
+    new_image_path = IMAGE_DIR / f"{image_id}{Path(image_path).suffix.lower()}"
+    if not new_image_path.exists():
+        atomic_write_bytes(new_image_path, image_data)
+
+    # (hash, model) -> summary
+    summary_path = SUMMARY_DIR / f"{image_id}_{model}.txt"
+    if summary_path.exists():
+        annotate(cache_hit=True)
+        return {
+            "image_id": image_id,
+            "image_path": str(new_image_path),
+            "summary_path": str(summary_path),
+            "summary": summary_path.read_text(),
+            "cached": True,
+        }
+
+    # Only the downscaled copy is uploaded; the original stays archived above
+    upload_data, mime_type = prepare_image_for_vision(image_data, get_mime_type(image_path))
+    annotate(cache_hit=False, image_bytes=len(image_data), upload_bytes=len(upload_data))
+
     # Encode the image data to base64
-    base64_image = base64.b64encode(image_data).decode('utf-8')
-    
-    # Get the MIME type of the image
-    mime_type = get_mime_type(image_path)
-    
+    base64_image = base64.b64encode(upload_data).decode('utf-8')
+
     if model in ["gpt-4o-mini", "gpt-4o"]:
         summary = summarize_with_gpt(base64_image, mime_type, model)
-    elif model == "claude-3-5-sonnet-20240620":
-        summary = summarize_with_claude(base64_image, mime_type)
     else:
-        raise ValueError("Unsupported model. Choose 'gpt-4o-mini', 'gpt-4o', or 'claude-3-5-sonnet-20240620'.")
-    
-    # Save the image to the file system
-    new_image_path = IMAGE_DIR / f"{image_id}{Path(image_path).suffix}"
-    with open(new_image_path, "wb") as new_image_file:
-        new_image_file.write(image_data)
-    
-    # Save the summary to a text file
-    summary_path = SUMMARY_DIR / f"{image_id}.txt"
-    with open(summary_path, "w") as summary_file:
-        summary_file.write(summary)
-    
+        summary = summarize_with_claude(base64_image, mime_type)
+
+    # Save the summary to a text file; errors are not cached so the next upload retries
+    if not summary.startswith("Error processing image"):
+        atomic_write_bytes(summary_path, summary.encode("utf-8"))
+
     return {
         "image_id": image_id,
         "image_path": str(new_image_path),
         "summary_path": str(summary_path),
         "summary": summary,
+        "cached": False,
     }
 
 def summarize_with_gpt(base64_image, mime_type, model):
     try:
-        response = openai_client.chat.completions.create(
+        response = governed_call("openai", model, lambda: get_openai_client().chat.completions.create(
             model=model,
             messages=[
                 {
@@ -83,14 +125,14 @@ def summarize_with_gpt(base64_image, mime_type, model):
                 }
             ],
             max_tokens=512,
-        )
+        ), IMAGE_TOKEN_ESTIMATE)
         return response.choices[0].message.content
     except Exception as e:
         return f"Error processing image with {model}: {str(e)}"
 
 def summarize_with_claude(base64_image, mime_type):
     try:
-        response = anthropic_client.messages.create(
+        response = governed_call("anthropic", "claude-3-5-sonnet-20240620", lambda: get_anthropic_client().messages.create(
             model="claude-3-5-sonnet-20240620",
             max_tokens=512,
             messages=[
@@ -112,7 +154,7 @@ def summarize_with_claude(base64_image, mime_type):
                     ],
                 }
             ],
-        )
+        ), IMAGE_TOKEN_ESTIMATE)
         return response.content[0].text
     except Exception as e:
         return f"Error processing image with Claude: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from modules.clients import get_openai_client
+from modules.call_governor import governed_call, estimate_tokens, DEFAULT_COMPLETION_TOKENS
+from modules.tracing import span
+
+LLM_CACHE_FILE = Path(os.getenv("WIS_LLM_CACHE_FILE", "llm_cache.db"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("WIS_LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_TTL = float(os.getenv("WIS_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_ENABLED = os.getenv("WIS_LLM_CACHE_ENABLED", "1") != "0"
+
+def normalize_prompt(text):
+    # Whitespace-only differences should not defeat the cache
+    return " ".join(str(text).split())
+
+def cache_key(model, system_prompt, user_prompt, *extra):
+    payload = json.dumps([model, normalize_prompt(system_prompt), normalize_prompt(user_prompt), *extra])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """Persistent, size-bounded LRU cache of LLM responses with a TTL."""
+
+    def __init__(self, database_file=LLM_CACHE_FILE, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL):
+        self.database_file = database_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection().execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._count("misses")
+            return None
+        conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return row[0]
+
+    def put(self, key, response):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT INTO llm_cache (key, response, created_at, last_used) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET response = excluded.response, created_at = excluded.created_at, last_used = excluded.last_used",
+            (key, response, now, now),
+        )
+        evicted = conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY last_used LIMIT max(0, (SELECT COUNT(*) FROM llm_cache) - ?))",
+            (self.max_entries,),
+        ).rowcount
+        if evicted:
+            self._count("evictions", evicted)
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LLMResponseCache()
+        return _response_cache
+
+def cached_chat_completion(model, system_prompt, user_prompt, use_cache=True, **kwargs):
+    # Only the text of the reply is cached; kwargs such as max_tokens are part of the key
+    with span("llm.chat_completion", model=model, cache_hit=False) as current:
+        use_cache = use_cache and LLM_CACHE_ENABLED
+        key = cache_key(model, system_prompt, user_prompt, sorted(kwargs.items()))
+        if use_cache:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                current.set(cache_hit=True)
+                return cached
+
+        response = governed_call("openai", model, lambda: get_openai_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            **kwargs,
+        ), estimate_tokens(system_prompt, user_prompt, completion_tokens=kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS))
+        content = response.choices[0].message.content
+
+        if use_cache:
+            get_response_cache().put(key, content)
+        return content
@@ -1,2 +1,52 @@
-def process_multimodal_input(text, image):
-    pass
\ No newline at end of file
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from modules.voice_processing import process_voice_input
+from modules.image_processing import summarize_image
+
+MULTIMODAL_MAX_WORKERS = int(os.getenv("WIS_MULTIMODAL_MAX_WORKERS", "4"))
+
+# Voice and vision calls hit different endpoints, so they can all be in flight at once
+_executor = ThreadPoolExecutor(max_workers=MULTIMODAL_MAX_WORKERS, thread_name_prefix="multimodal")
+
+def _as_list(files):
+    if not files:
+        return []
+    if isinstance(files, (list, tuple)):
+        return [f for f in files if f]
+    return [files]
+
+def split_media_files(files):
+    # Returns (audio, images, skipped). Video containers such as the video/webm
+    # a browser records voice notes in are transcribed from their audio track;
+    # anything else is returned as skipped so the caller can say so.
+    audio_files, image_files, skipped = [], [], []
+    for file_path in _as_list(files):
+        mime_type, _ = mimetypes.guess_type(file_path)
+        if mime_type and mime_type.startswith(("audio/", "video/")):
+            audio_files.append(file_path)
+        elif mime_type and mime_type.startswith("image/"):
+            image_files.append(file_path)
+        else:
+            skipped.append(file_path)
+    return audio_files, image_files, skipped
+
+def describe_image(image, model):
+    try:
+        result = summarize_image(image, model=model)
+        if result['summary'].startswith("Error processing image"):
+            return result['summary']
+        return f"Image processed with {model} (ID: {result['image_id']}):\n{result['summary']}"
+    except Exception as e:
+        return f"Error processing image: {str(e)}"
+
+def process_multimodal_input(audio, image, model="gpt-4o-mini"):
+    # audio and image may each be a single file path or a list of them
+    voice_futures = [_executor.submit(process_voice_input, audio_file) for audio_file in _as_list(audio)]
+    image_futures = [_executor.submit(describe_image, image_file, model) for image_file in _as_list(image)]
+
+    # Results are joined in submission order regardless of which call finished first
+    voice_text = "\n".join(future.result() for future in voice_futures)
+    image_summary = "\n\n".join(future.result() for future in image_futures)
+
+    return f"Voice input: {voice_text}\n\nImage summary: {image_summary}".strip()
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from modules.clients import get_openai_client
+from modules.call_governor import governed_call, estimate_tokens
+from modules.storage import atomic_write_json
+from modules.tracing import span
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PASSAGE_INDEX_ENABLED = os.getenv("WIS_PASSAGE_INDEX_ENABLED", "1") != "0"
+PASSAGE_INDEX_DIR = Path(os.getenv("WIS_PASSAGE_INDEX_DIR", "passage_index"))
+PASSAGE_INDEX_CACHE_SIZE = int(os.getenv("WIS_PASSAGE_INDEX_CACHE_SIZE", "256"))
+EMBEDDING_MODEL = os.getenv("WIS_EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS = int(os.getenv("WIS_EMBEDDING_DIMENSIONS", "256"))
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_MAX_CHARS = 8000
+
+logger = logging.getLogger(__name__)
+
+def embed_texts(texts):
+    # Unit-length float32 rows, so a dot product is the cosine similarity
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = [text[:EMBEDDING_MAX_CHARS] or " " for text in texts[start:start + EMBEDDING_BATCH_SIZE]]
+        response = governed_call(
+            "openai", EMBEDDING_MODEL,
+            lambda: get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=batch, dimensions=EMBEDDING_DIMENSIONS),
+            estimate_tokens(*batch, completion_tokens=0),
+        )
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(texts), EMBEDDING_DIMENSIONS)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+class PassageIndex:
+    """Embeddings of one agent's archival passages, kept on disk.
+
+    ``vectors.f32`` is a float32 matrix with one row per passage, read
+    through a memory map, and ``ids.json`` maps rows to passage ids.
+    Passages never change once written, so rows are only ever appended.
+    """
+
+    def __init__(self, directory, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS):
+        self.directory = directory
+        self.model = model
+        self.dimensions = dimensions
+        self.lock = threading.Lock()
+        self.vectors_file = directory / "vectors.f32"
+        self.ids_file = directory / "ids.json"
+        self._vectors = None
+        self.ids = []
+        if self.ids_file.exists():
+            meta = json.loads(self.ids_file.read_text())
+            # A different model or size makes the stored vectors meaningless
+            if meta.get('model') == model and meta.get('dimensions') == dimensions:
+                self.ids = meta['ids']
+        self._repair()
+        self.rows = {passage_id: row for row, passage_id in enumerate(self.ids)}
+
+    def _repair(self):
+        # Vectors are appended before the id map is saved, so a crash in between
+        # leaves extra rows; drop them, or start over if rows are missing
+        expected = len(self.ids) * self.dimensions * 4
+        actual = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        if actual < expected:
+            self.ids = []
+            expected = 0
+        if actual > expected:
+            with open(self.vectors_file, "r+b") as f:
+                f.truncate(expected)
+
+    def vectors(self):
+        if self._vectors is None:
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode="r", shape=(len(self.ids), self.dimensions))
+        return self._vectors
+
+    def add(self, passages):
+        # Called with self.lock held; returns the number of newly embedded passages
+        new = list({passage.id: passage for passage in passages if passage.id not in self.rows}.values())
+        if not new:
+            return 0
+        matrix = embed_texts([passage.text for passage in new])
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.vectors_file, "ab") as f:
+            f.write(matrix.tobytes())
+        ids = self.ids + [passage.id for passage in new]
+        atomic_write_json(self.ids_file, {'model': self.model, 'dimensions': self.dimensions, 'ids': ids})
+        for passage in new:
+            self.rows[passage.id] = len(self.rows)
+        self.ids = ids
+        self._vectors = None
+        return len(new)
+
+    def top_k(self, passages, query_vector, k):
+        # Only the candidates' rows are read from the memory map
+        rows = np.fromiter((self.rows[passage.id] for passage in passages), dtype=np.int64, count=len(passages))
+        scores = self.vectors()[rows] @ query_vector
+        best = set(np.argpartition(-scores, k - 1)[:k].tolist())
+        return [passage for position, passage in enumerate(passages) if position in best]
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_query_vectors = {}
+
+def get_passage_index(agent_id):
+    with _indexes_lock:
+        index = _indexes.get(agent_id)
+        if index is None:
+            index = _indexes[agent_id] = PassageIndex(PASSAGE_INDEX_DIR / agent_id)
+        _indexes.move_to_end(agent_id)
+        while len(_indexes) > PASSAGE_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+        return index
+
+def _query_vector(query):
+    # Queries are a few fixed strings, so each is embedded once per process
+    vector = _query_vectors.get(query)
+    if vector is None:
+        vector = _query_vectors[query] = embed_texts([query])[0]
+    return vector
+
+def rank_passages(agent_id, passages, query, k):
+    """Return the ``k`` passages most similar to ``query``, in their original order.
+
+    Passages missing from the agent's index are embedded and appended first.
+    Returns None if the index cannot be used (disabled, numpy missing or the
+    embedding call failed) so callers can fall back to their own selection.
+    """
+    if np is None or not PASSAGE_INDEX_ENABLED:
+        return None
+    if len(passages) <= k:
+        return list(passages)
+    with span("passages.rank", candidates=len(passages)) as current:
+        try:
+            index = get_passage_index(agent_id)
+            with index.lock:
+                current.set(embedded=index.add(passages))
+                return index.top_k(passages, _query_vector(query), k)
+        except Exception:
+            logger.warning("Falling back to recent passages for agent %s", agent_id, exc_info=True)
+            return None
@@ -0,0 +1,100 @@
+import os
+from modules.tracing import span
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("WIS_PROMPT_TOKEN_BUDGET", "12000"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+class PromptSection:
+    def __init__(self, header):
+        self.header = header
+        self.parts = []  # [title, lines oldest first, token count per line]
+
+    def add_part(self, title, lines):
+        lines = list(lines)
+        if lines:
+            self.parts.append([title, lines, [count_tokens(line) + 1 for line in lines]])
+
+    def tokens(self):
+        return count_tokens(self.header) + sum(count_tokens(title) + sum(counts) + 2 for title, _, counts in self.parts)
+
+    def fit(self, budget):
+        # Drop the oldest line of whichever part is currently largest until the section fits
+        total = self.tokens()
+        while total > budget:
+            part = max(self.parts, key=lambda part: sum(part[2]), default=None)
+            if part is None or not part[1]:
+                break
+            part[1].pop(0)
+            total -= part[2].pop(0)
+            if not part[1]:
+                self.parts.remove(part)
+                total -= count_tokens(part[0]) + 2
+
+    def render(self):
+        chunks = [self.header]
+        for title, lines, _ in self.parts:
+            chunks.append(title)
+            chunks.extend(lines)
+            chunks.append("")
+        return "\n".join(chunks) + "\n"
+
+class PromptBuilder:
+    """Assembles a prompt from fixed text and per-member sections within a token budget.
+
+    Fixed text is always kept. Whatever budget is left is split fairly
+    between sections: small sections keep everything and the remainder is
+    shared evenly by the larger ones, which lose their oldest lines first.
+    """
+
+    def __init__(self, budget_tokens=PROMPT_TOKEN_BUDGET):
+        self.budget_tokens = budget_tokens
+        self.token_count = None
+        self.dropped_lines = 0
+        self._pieces = []
+
+    def add(self, text):
+        self._pieces.append(text)
+
+    def section(self, header):
+        section = PromptSection(header)
+        self._pieces.append(section)
+        return section
+
+    def _apportion(self, sections):
+        fixed = sum(count_tokens(piece) for piece in self._pieces if isinstance(piece, str))
+        remaining = max(self.budget_tokens - fixed, 0)
+        needs = sorted(sections, key=lambda section: section.tokens())
+        shares = {}
+        for index, section in enumerate(needs):
+            share = remaining // (len(needs) - index)
+            shares[id(section)] = min(section.tokens(), share)
+            remaining -= shares[id(section)]
+        return shares
+
+    def build(self):
+        with span("prompt.build") as current:
+            sections = [piece for piece in self._pieces if isinstance(piece, PromptSection)]
+            before = sum(len(part[1]) for section in sections for part in section.parts)
+            shares = self._apportion(sections)
+            for section in sections:
+                section.fit(shares[id(section)])
+            self.dropped_lines = before - sum(len(part[1]) for section in sections for part in section.parts)
+
+            chunks = []
+            for piece in self._pieces:
+                chunks.append(piece.render() if isinstance(piece, PromptSection) else piece)
+            prompt = "\n".join(chunks)
+            self.token_count = count_tokens(prompt)
+            current.set(prompt_tokens=self.token_count, dropped_lines=self.dropped_lines, sections=len(sections))
+            return prompt
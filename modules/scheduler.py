@@ -0,0 +1,129 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules.user_management import get_group_agent_id
+from modules.bulletin_board import create_or_update_group_bulletin
+from modules.todo_list import create_or_update_todo_list, TODO_REPRIORITIZE
+from modules.call_governor import background_priority
+
+REFRESH_INTERVAL = float(os.getenv("WIS_REFRESH_INTERVAL", "900"))
+REFRESH_DEBOUNCE = float(os.getenv("WIS_REFRESH_DEBOUNCE", "30"))
+REFRESH_MAX_DELAY = float(os.getenv("WIS_REFRESH_MAX_DELAY", "120"))
+REFRESH_WORKERS = int(os.getenv("WIS_REFRESH_WORKERS", "2"))
+
+ARTIFACT_REFRESHERS = {
+    "bulletin": create_or_update_group_bulletin,
+}
+if TODO_REPRIORITIZE:
+    ARTIFACT_REFRESHERS["todo"] = create_or_update_todo_list
+
+logger = logging.getLogger(__name__)
+
+class GroupRefreshScheduler:
+    """Refreshes group artifacts in the background.
+
+    Each (group, artifact) pair has at most one pending refresh. Activity
+    triggers push it back by the debounce delay, bounded by max_delay from
+    the first request, so a burst of activity costs a single regeneration.
+    Registered groups are also refreshed every ``interval`` seconds.
+    """
+
+    def __init__(self, refreshers=ARTIFACT_REFRESHERS, interval=REFRESH_INTERVAL, debounce=REFRESH_DEBOUNCE,
+                 max_delay=REFRESH_MAX_DELAY, max_workers=REFRESH_WORKERS):
+        self.refreshers = refreshers
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending = {}  # (group, artifact) -> (due, first activity request or None if periodic)
+        self._heap = []
+        self._running = set()
+        self._periodic = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="group-refresh")
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="group-refresh-scheduler", daemon=True)
+                self._thread.start()
+
+    def register_group(self, group_name):
+        with self._cond:
+            self._periodic.add(group_name)
+            for artifact in self.refreshers:
+                self._schedule((group_name, artifact), time.monotonic() + self.interval)
+            self._cond.notify()
+
+    def request_refresh(self, group_name, artifacts=None, delay=None):
+        delay = self.debounce if delay is None else delay
+        now = time.monotonic()
+        with self._cond:
+            for artifact in artifacts or self.refreshers:
+                if artifact not in self.refreshers:
+                    # E.g. the todo pass when reprioritization is turned off
+                    continue
+                key = (group_name, artifact)
+                _, first_requested = self._pending.get(key, (None, None))
+                first_requested = now if first_requested is None else first_requested
+                due = min(now + delay, first_requested + self.max_delay)
+                self._schedule(key, due, first_requested)
+            self._cond.notify()
+
+    def _schedule(self, key, due, first_requested=None):
+        current = self._pending.get(key)
+        # A periodic refresh must not postpone an activity-triggered one that is already due sooner
+        if current is not None and first_requested is None and current[0] <= due:
+            return
+        self._pending[key] = (due, first_requested)
+        heapq.heappush(self._heap, (due, key))
+
+    def _pop_due(self):
+        now = time.monotonic()
+        due_keys = []
+        while self._heap and self._heap[0][0] <= now:
+            due, key = heapq.heappop(self._heap)
+            entry = self._pending.get(key)
+            # Stale heap entries are left behind when a refresh is rescheduled
+            if entry is None or entry[0] != due:
+                continue
+            if key in self._running:
+                # Run again once the current refresh finishes
+                self._pending[key] = (now + self.debounce, entry[1])
+                heapq.heappush(self._heap, (now + self.debounce, key))
+                continue
+            del self._pending[key]
+            self._running.add(key)
+            due_keys.append(key)
+        return due_keys
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                due_keys = self._pop_due()
+                while not due_keys:
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                    due_keys = self._pop_due()
+            for key in due_keys:
+                self._executor.submit(self._refresh, key)
+
+    def _refresh(self, key):
+        group_name, artifact = key
+        try:
+            # Queued behind interactive requests for the same provider quota
+            with background_priority():
+                self.refreshers[artifact](group_name, get_group_agent_id(group_name))
+        except Exception:
+            logger.exception("Background %s refresh failed for group %s", artifact, group_name)
+        finally:
+            with self._cond:
+                self._running.discard(key)
+                if group_name in self._periodic:
+                    self._schedule(key, time.monotonic() + self.interval)
+                self._cond.notify()
+
+scheduler = GroupRefreshScheduler()
@@ -0,0 +1,569 @@
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from modules.tracing import trace_client
+
+USERS_FILE = Path("users.json")
+GROUPS_FILE = Path("groups.json")
+GROUP_DATA_DIR = Path("group_data")
+DATABASE_FILE = Path(os.getenv("WIS_DATABASE_FILE", "wis.db"))
+STORAGE_BACKEND = os.getenv("WIS_STORAGE_BACKEND", "sqlite")
+LEGACY_GROUP_DATA_TYPES = ("bulletin", "todo")
+
+def atomic_write_bytes(path, data):
+    # Write to a sibling temp file and rename so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def atomic_write_json(path, data):
+    atomic_write_bytes(path, json.dumps(data).encode("utf-8"))
+
+class JSONStorage:
+    """Legacy users.json/groups.json backend with in-memory indexes.
+
+    Files are only re-parsed when their inode, mtime or size changes, and all
+    writes go through this object so the indexes never go stale. Writes are
+    atomic but only serialized within one process.
+    """
+
+    def __init__(self, users_file=USERS_FILE, groups_file=GROUPS_FILE, group_data_dir=GROUP_DATA_DIR):
+        self.users_file = users_file
+        self.groups_file = groups_file
+        self.group_data_dir = group_data_dir
+        self.group_data_dir.mkdir(exist_ok=True)
+        self.lock = threading.RLock()
+        self._users = {}
+        self._groups = {}
+        self._users_stamp = None
+        self._groups_stamp = None
+        self._users_by_group = {}
+        self._agent_names = set()
+        self._event_seqs = {}
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _read(path):
+        if path.exists():
+            with open(path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def _reindex_users(self):
+        self._users_by_group = {}
+        self._agent_names = set()
+        for username, user_data in self._users.items():
+            group = user_data.get('group')
+            if group:
+                self._users_by_group.setdefault(group, []).append(username)
+            self._agent_names.add(user_data['agent_name'])
+
+    def _refresh(self):
+        users_stamp = self._stamp(self.users_file)
+        if users_stamp != self._users_stamp:
+            self._users = self._read(self.users_file)
+            self._users_stamp = users_stamp
+            self._reindex_users()
+        groups_stamp = self._stamp(self.groups_file)
+        if groups_stamp != self._groups_stamp:
+            self._groups = self._read(self.groups_file)
+            self._groups_stamp = groups_stamp
+
+    def _write(self, path, data):
+        atomic_write_json(path, data)
+        return self._stamp(path)
+
+    def _save_users(self):
+        self._users_stamp = self._write(self.users_file, self._users)
+        self._reindex_users()
+
+    def _save_groups(self):
+        self._groups_stamp = self._write(self.groups_file, self._groups)
+
+    def get_user(self, username):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self._users.get(username))
+
+    def get_group(self, group_name):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self._groups.get(group_name))
+
+    def users(self):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self._users)
+
+    def groups(self):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self._groups)
+
+    def group_names(self):
+        with self.lock:
+            self._refresh()
+            return set(self._groups) | set(self._users_by_group)
+
+    def users_in_group(self, group_name):
+        with self.lock:
+            self._refresh()
+            return list(self._users_by_group.get(group_name, []))
+
+    def has_agent_name(self, agent_name):
+        with self.lock:
+            self._refresh()
+            return agent_name in self._agent_names
+
+    def group_members(self, group_name):
+        with self.lock:
+            self._refresh()
+            group = self._groups.get(group_name)
+            if group is None:
+                return {}
+            return {username: self._users[username]['agent_id'] for username in group['members']}
+
+    def add_user(self, username, user_data, new_group=None):
+        with self.lock:
+            self._refresh()
+            if username in self._users:
+                return None
+            group_name = user_data['group']
+            if group_name not in self._groups:
+                self._groups[group_name] = dict(new_group or {}, members=[])
+            self._groups[group_name]['members'].append(username)
+            self._users[username] = dict(user_data)
+            # Save the user first so the group's member index can resolve it
+            self._save_users()
+            self._save_groups()
+            return copy.deepcopy(self._groups[group_name])
+
+    def claim_group_agent(self, group_name, agent_id, agent_name):
+        with self.lock:
+            self._refresh()
+            group = self._groups.setdefault(group_name, {'members': []})
+            if 'agent_id' not in group:
+                group['agent_id'] = agent_id
+                group['agent_name'] = agent_name
+                self._save_groups()
+            return copy.deepcopy(group)
+
+    def add_group_members(self, group_name, usernames):
+        with self.lock:
+            self._refresh()
+            group = self._groups.setdefault(group_name, {'members': []})
+            new_members = [username for username in usernames if username not in group['members']]
+            if new_members:
+                group['members'].extend(new_members)
+                self._save_groups()
+
+    def replace_users(self, users):
+        with self.lock:
+            self._users = copy.deepcopy(users)
+            self._save_users()
+
+    def replace_groups(self, groups):
+        with self.lock:
+            self._groups = copy.deepcopy(groups)
+            self._save_groups()
+
+    def save_group_data(self, group_name, data_type, content):
+        atomic_write_json(self.group_data_dir / f"{group_name}_{data_type}.json", content)
+
+    def load_group_data(self, group_name, data_type):
+        file_path = self.group_data_dir / f"{group_name}_{data_type}.json"
+        if file_path.exists():
+            with open(file_path, "r") as f:
+                return json.load(f)
+        return None
+
+    def _events_file(self, group_name, log_name):
+        return self.group_data_dir / f"{group_name}_{log_name}.jsonl"
+
+    def _read_events(self, group_name, log_name):
+        file_path = self._events_file(group_name, log_name)
+        if not file_path.exists():
+            return []
+        with open(file_path, "r") as f:
+            # A torn last line from a crash mid-append is ignored
+            lines = f.read().split("\n")
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+        return [(record['seq'], record['event']) for record in events]
+
+    def _last_seq(self, group_name, log_name):
+        key = (group_name, log_name)
+        if key not in self._event_seqs:
+            events = self._read_events(group_name, log_name)
+            snapshot = self.load_group_snapshot(group_name, log_name) or {'seq': 0}
+            self._event_seqs[key] = max([snapshot['seq']] + [seq for seq, _ in events])
+        return self._event_seqs[key]
+
+    def append_group_event(self, group_name, log_name, event):
+        with self.lock:
+            seq = self._last_seq(group_name, log_name) + 1
+            line = (json.dumps({'seq': seq, 'event': event}) + "\n").encode("utf-8")
+            with open(self._events_file(group_name, log_name), "a+b") as f:
+                # Start a fresh line if a previous append was torn
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = b"\n" + line
+                f.write(line)
+            self._event_seqs[(group_name, log_name)] = seq
+            return seq
+
+    def load_group_events(self, group_name, log_name, after_seq=0):
+        with self.lock:
+            return [(seq, event) for seq, event in self._read_events(group_name, log_name) if seq > after_seq]
+
+    def load_group_snapshot(self, group_name, log_name):
+        return self.load_group_data(group_name, f"{log_name}_snapshot")
+
+    def compact_group_events(self, group_name, log_name, state, upto_seq):
+        with self.lock:
+            snapshot = self.load_group_snapshot(group_name, log_name)
+            if snapshot is not None and snapshot['seq'] >= upto_seq:
+                return False
+            # Snapshot first: a crash before the log is rewritten only leaves events readers skip
+            self.save_group_data(group_name, f"{log_name}_snapshot", {'seq': upto_seq, 'state': state})
+            records = [
+                {'seq': seq, 'event': event}
+                for seq, event in self._read_events(group_name, log_name) if seq > upto_seq
+            ]
+            seq = self._last_seq(group_name, log_name) + 1
+            records.append({'seq': seq, 'event': {'op': 'compacted', 'upto': upto_seq}})
+            file_path = self._events_file(group_name, log_name)
+            atomic_write_bytes(file_path, "".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+            self._event_seqs[(group_name, log_name)] = seq
+            return True
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    agent_name TEXT NOT NULL UNIQUE,
+    group_name TEXT
+);
+CREATE INDEX IF NOT EXISTS users_group_name ON users (group_name);
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT PRIMARY KEY,
+    agent_id TEXT,
+    agent_name TEXT
+);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_name TEXT NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (group_name, username)
+);
+CREATE TABLE IF NOT EXISTS group_data (
+    group_name TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (group_name, data_type)
+);
+CREATE TABLE IF NOT EXISTS group_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_name TEXT NOT NULL,
+    log_name TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS group_events_log ON group_events (group_name, log_name, seq);
+"""
+
+class SQLiteStorage:
+    """WAL-mode SQLite backend with row-level upserts.
+
+    Every write runs in a BEGIN IMMEDIATE transaction, so concurrent
+    registrations from several threads or worker processes cannot lose
+    each other's updates.
+    """
+
+    def __init__(self, database_file=DATABASE_FILE):
+        self.database_file = database_file
+        self._local = threading.local()
+        with self._transaction() as conn:
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _user_record(row):
+        user_data = {
+            'password': row['password'],
+            'agent_id': row['agent_id'],
+            'agent_name': row['agent_name'],
+        }
+        if row['group_name'] is not None:
+            user_data['group'] = row['group_name']
+        return user_data
+
+    def _members(self, conn, group_name):
+        rows = conn.execute(
+            "SELECT username FROM group_members WHERE group_name = ? ORDER BY rowid", (group_name,)
+        )
+        return [row['username'] for row in rows]
+
+    def _group_record(self, conn, row):
+        group_data = {'members': self._members(conn, row['name'])}
+        if row['agent_id'] is not None:
+            group_data['agent_id'] = row['agent_id']
+            group_data['agent_name'] = row['agent_name']
+        return group_data
+
+    def _get_group(self, conn, group_name):
+        row = conn.execute("SELECT * FROM groups WHERE name = ?", (group_name,)).fetchone()
+        return self._group_record(conn, row) if row else None
+
+    def is_empty(self):
+        return self._connection().execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def get_user(self, username):
+        row = self._connection().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return self._user_record(row) if row else None
+
+    def get_group(self, group_name):
+        return self._get_group(self._connection(), group_name)
+
+    def users(self):
+        rows = self._connection().execute("SELECT * FROM users")
+        return {row['username']: self._user_record(row) for row in rows}
+
+    def groups(self):
+        conn = self._connection()
+        return {row['name']: self._group_record(conn, row) for row in conn.execute("SELECT * FROM groups").fetchall()}
+
+    def group_names(self):
+        rows = self._connection().execute(
+            "SELECT name FROM groups UNION SELECT group_name FROM users WHERE group_name IS NOT NULL"
+        )
+        return {row[0] for row in rows}
+
+    def users_in_group(self, group_name):
+        rows = self._connection().execute("SELECT username FROM users WHERE group_name = ?", (group_name,))
+        return [row['username'] for row in rows]
+
+    def has_agent_name(self, agent_name):
+        row = self._connection().execute("SELECT 1 FROM users WHERE agent_name = ?", (agent_name,)).fetchone()
+        return row is not None
+
+    def group_members(self, group_name):
+        rows = self._connection().execute(
+            "SELECT m.username, u.agent_id FROM group_members m JOIN users u ON u.username = m.username "
+            "WHERE m.group_name = ? ORDER BY m.rowid",
+            (group_name,),
+        )
+        return {row['username']: row['agent_id'] for row in rows}
+
+    def add_user(self, username, user_data, new_group=None):
+        group_name = user_data['group']
+        new_group = new_group or {}
+        with self._transaction() as conn:
+            inserted = conn.execute(
+                "INSERT INTO users (username, password, agent_id, agent_name, group_name) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (username) DO NOTHING",
+                (username, user_data['password'], user_data['agent_id'], user_data['agent_name'], group_name),
+            ).rowcount
+            if not inserted:
+                return None
+            conn.execute(
+                "INSERT INTO groups (name, agent_id, agent_name) VALUES (?, ?, ?) ON CONFLICT (name) DO NOTHING",
+                (group_name, new_group.get('agent_id'), new_group.get('agent_name')),
+            )
+            conn.execute(
+                "INSERT INTO group_members (group_name, username) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                (group_name, username),
+            )
+            return self._get_group(conn, group_name)
+
+    def claim_group_agent(self, group_name, agent_id, agent_name):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO groups (name, agent_id, agent_name) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET agent_id = excluded.agent_id, agent_name = excluded.agent_name "
+                "WHERE groups.agent_id IS NULL",
+                (group_name, agent_id, agent_name),
+            )
+            return self._get_group(conn, group_name)
+
+    def add_group_members(self, group_name, usernames):
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO groups (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (group_name,))
+            conn.executemany(
+                "INSERT INTO group_members (group_name, username) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                [(group_name, username) for username in usernames],
+            )
+
+    def replace_users(self, users):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM users")
+            self._insert_users(conn, users)
+
+    def replace_groups(self, groups):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM groups")
+            conn.execute("DELETE FROM group_members")
+            self._insert_groups(conn, groups)
+
+    @staticmethod
+    def _insert_users(conn, users):
+        conn.executemany(
+            "INSERT INTO users (username, password, agent_id, agent_name, group_name) VALUES (?, ?, ?, ?, ?)",
+            [
+                (username, user_data['password'], user_data['agent_id'], user_data['agent_name'], user_data.get('group'))
+                for username, user_data in users.items()
+            ],
+        )
+
+    @staticmethod
+    def _insert_groups(conn, groups):
+        conn.executemany(
+            "INSERT INTO groups (name, agent_id, agent_name) VALUES (?, ?, ?)",
+            [(name, group.get('agent_id'), group.get('agent_name')) for name, group in groups.items()],
+        )
+        conn.executemany(
+            "INSERT INTO group_members (group_name, username) VALUES (?, ?) ON CONFLICT DO NOTHING",
+            [(name, username) for name, group in groups.items() for username in group.get('members', [])],
+        )
+
+    def save_group_data(self, group_name, data_type, content):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO group_data (group_name, data_type, content, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (group_name, data_type) DO UPDATE SET content = excluded.content, updated_at = excluded.updated_at",
+                (group_name, data_type, json.dumps(content), time.time()),
+            )
+
+    def load_group_data(self, group_name, data_type):
+        row = self._connection().execute(
+            "SELECT content FROM group_data WHERE group_name = ? AND data_type = ?", (group_name, data_type)
+        ).fetchone()
+        return json.loads(row['content']) if row else None
+
+    def append_group_event(self, group_name, log_name, event):
+        with self._transaction() as conn:
+            return conn.execute(
+                "INSERT INTO group_events (group_name, log_name, event, created_at) VALUES (?, ?, ?, ?)",
+                (group_name, log_name, json.dumps(event), time.time()),
+            ).lastrowid
+
+    def load_group_events(self, group_name, log_name, after_seq=0):
+        rows = self._connection().execute(
+            "SELECT seq, event FROM group_events WHERE group_name = ? AND log_name = ? AND seq > ? ORDER BY seq",
+            (group_name, log_name, after_seq),
+        )
+        return [(row['seq'], json.loads(row['event'])) for row in rows]
+
+    def load_group_snapshot(self, group_name, log_name):
+        return self.load_group_data(group_name, f"{log_name}_snapshot")
+
+    def compact_group_events(self, group_name, log_name, state, upto_seq):
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT content FROM group_data WHERE group_name = ? AND data_type = ?",
+                (group_name, f"{log_name}_snapshot"),
+            ).fetchone()
+            if row is not None and json.loads(row['content'])['seq'] >= upto_seq:
+                return False
+            conn.execute(
+                "INSERT INTO group_data (group_name, data_type, content, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (group_name, data_type) DO UPDATE SET content = excluded.content, updated_at = excluded.updated_at",
+                (group_name, f"{log_name}_snapshot", json.dumps({'seq': upto_seq, 'state': state}), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM group_events WHERE group_name = ? AND log_name = ? AND seq <= ?",
+                (group_name, log_name, upto_seq),
+            )
+            conn.execute(
+                "INSERT INTO group_events (group_name, log_name, event, created_at) VALUES (?, ?, ?, ?)",
+                (group_name, log_name, json.dumps({'op': 'compacted', 'upto': upto_seq}), time.time()),
+            )
+            return True
+
+def migrate_json_to_sqlite(sqlite_storage, users_file=USERS_FILE, groups_file=GROUPS_FILE, group_data_dir=GROUP_DATA_DIR):
+    json_storage = JSONStorage(users_file, groups_file, group_data_dir)
+    users = json_storage.users()
+    groups = json_storage.groups()
+    with sqlite_storage._transaction() as conn:
+        if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+            return False
+        sqlite_storage._insert_users(conn, users)
+        sqlite_storage._insert_groups(conn, groups)
+        for file_path in group_data_dir.glob("*.json"):
+            # Files are named <group>_<data_type>.json and group names may contain underscores
+            data_type = next((t for t in LEGACY_GROUP_DATA_TYPES if file_path.stem.endswith(f"_{t}")), None)
+            if data_type is None:
+                continue
+            group_name = file_path.stem[:-len(data_type) - 1]
+            with open(file_path, "r") as f:
+                content = f.read()
+            conn.execute(
+                "INSERT INTO group_data (group_name, data_type, content, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (group_name, data_type) DO NOTHING",
+                (group_name, data_type, content, file_path.stat().st_mtime),
+            )
+    return True
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "json":
+                _storage = JSONStorage()
+            elif STORAGE_BACKEND == "sqlite":
+                _storage = SQLiteStorage()
+                if _storage.is_empty() and (USERS_FILE.exists() or GROUPS_FILE.exists()):
+                    migrate_json_to_sqlite(_storage)
+            else:
+                raise ValueError(f"Unsupported storage backend: {STORAGE_BACKEND}. Choose 'sqlite' or 'json'.")
+            _storage = trace_client(_storage, f"storage.{STORAGE_BACKEND}")
+        return _storage
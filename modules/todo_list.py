@@ -1,89 +1,241 @@
-from modules.user_management import get_group_members, get_comprehensive_agent_data, letta_client
-from modules.group_data_storage import save_group_data, load_group_data
-from datetime import datetime, timedelta
-from letta.schemas.message import MessageRole
+from modules.user_management import get_group_members, as_utc
+from modules.group_context import get_group_snapshots, decode_message, format_entry
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import heapq
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import logging
 import os
+import re
+import threading
+from modules.llm_cache import cached_chat_completion
+from modules.prompt_builder import PromptBuilder
+from modules.group_summaries import use_map_reduce, summarize_members
+from modules.coalescing import artifact_flights
+from modules.todo_store import get_todo_store, new_todo_item, update_event
+from modules.passage_index import rank_passages
+from modules.tracing import traced
 
-# Load environment variables from .env file
-load_dotenv()
+TODO_MAX_SNIPPETS = int(os.getenv("WIS_TODO_MAX_SNIPPETS", "40"))
+TODO_MIN_SNIPPETS_PER_MEMBER = 2
+TODO_SNIPPET_MAX_CHARS = 500
+TODO_CANDIDATE_CACHE_SIZE = 100000
+TODO_MAX_OPEN_ITEMS = 10
+# The LLM pass only reorders, rewords and closes items; "0" turns it off entirely
+TODO_REPRIORITIZE = os.getenv("WIS_TODO_REPRIORITIZE", "1") != "0"
+TODO_WINDOW_DAYS = float(os.getenv("WIS_TODO_WINDOW_DAYS", "7"))
+TODO_DONE_SHOWN = 5
+TODO_MEMBER_FOCUS = "This summary will feed a shared group to-do list, so focus on open tasks, errands, deadlines and who owns them."
+TODO_PASSAGE_QUERY = "Tasks, errands, deadlines, appointments and reminders that someone needs to take care of."
 
-def create_or_update_todo_list(group_name, group_agent_id, new_item=None):
+# Explicit mentions of todos/tasks weigh more than general intent phrases
+TODO_KEYWORDS = re.compile(r"\b(?:to-?dos?|tasks?|checklist)\b", re.IGNORECASE)
+TODO_INTENT = re.compile(
+    r"\b(?:remind(?:er|ers)?|deadline|due|don'?t forget|need(?:s)? to|have to|has to|must|should|"
+    r"schedule|appointment|buy|pick up|drop off|call|book|pay|renew|finish|submit|prepare|plan)\b",
+    re.IGNORECASE,
+)
+
+logger = logging.getLogger(__name__)
+
+# item id -> [(score, kind, line)]; messages and passages never change, so each is scored once
+_candidates = OrderedDict()
+_candidates_lock = threading.Lock()
+
+def score_todo_text(text):
+    keyword_hits = len(TODO_KEYWORDS.findall(text))
+    intent_hits = len(TODO_INTENT.findall(text))
+    if not keyword_hits and not intent_hits:
+        return 0
+    return 3 * min(keyword_hits, 3) + min(intent_hits, 3)
+
+def _truncate(text):
+    return text if len(text) <= TODO_SNIPPET_MAX_CHARS else text[:TODO_SNIPPET_MAX_CHARS] + "…"
+
+def _item_candidates(item, kind):
+    with _candidates_lock:
+        cached = _candidates.get(item.id)
+        if cached is not None:
+            _candidates.move_to_end(item.id)
+            return cached
+
+    if kind == "message":
+        entries = decode_message(item)
+    else:
+        entries = [(None, None, item.text)]
+    candidates = []
+    for speaker, time, text in entries:
+        score = score_todo_text(text)
+        if score:
+            line = format_entry(speaker, time, _truncate(text)) if speaker else f"- {_truncate(text)}"
+            candidates.append((score, kind, line))
+
+    with _candidates_lock:
+        _candidates[item.id] = candidates
+        while len(_candidates) > TODO_CANDIDATE_CACHE_SIZE:
+            _candidates.popitem(last=False)
+    return candidates
+
+def extract_todo_candidates(agent_data, limit, since=None, agent_id=None):
+    # Rank by relevance, break ties by recency, then restore chronological order for the prompt.
+    # Only passages with keyword hits are considered. Given the agent id, up to half the
+    # limit goes to those the embedding index ranks closest to todo content; otherwise
+    # they are keyword-ranked along with the messages.
+    def recent(items):
+        return [item for item in items if since is None or as_utc(item.created_at) >= since]
+
+    passages = [passage for passage in recent(agent_data['archival_memory_passages']) if _item_candidates(passage, "memory")]
+    memories = rank_passages(agent_id, passages, TODO_PASSAGE_QUERY, max(1, limit // 2)) if agent_id else None
+    sources = [("message", recent(agent_data['messages']))]
+    if memories is None:
+        sources.append(("memory", passages))
+        memories = []
+
+    ranked = []
+    for kind, items in sources:
+        for item in items:
+            for score, item_kind, line in _item_candidates(item, kind):
+                ranked.append((score, item.created_at, item_kind, line))
+    top = heapq.nlargest(limit - len(memories), ranked, key=lambda candidate: (candidate[0], candidate[1]))
+    top.extend((None, passage.created_at, "memory", f"- {_truncate(passage.text)}") for passage in memories)
+    return sorted(top, key=lambda candidate: candidate[1])
+
+def _add_candidates(section, agent_data, limit, since=None, agent_id=None):
+    candidates = extract_todo_candidates(agent_data, limit, since, agent_id)
+    section.add_part("Recent todo-related messages:", (line for _, _, kind, line in candidates if kind == "message"))
+    section.add_part("Recent todo-related memories:", (line for _, _, kind, line in candidates if kind == "memory"))
+
+
+def _render_item(item):
+    box = "[x]" if item['status'] == 'done' else "[ ]"
+    owner = f" _({item['owner']})_" if item['owner'] else ""
+    return f"- {box} {item['text']}{owner} `{item['id']}`"
+
+def render_todo_list(group_name, items):
+    open_items = [item for item in items if item['status'] == 'open']
+    done_items = sorted((item for item in items if item['status'] == 'done'), key=lambda item: item['updated_at'])
+    lines = [f"## To-Do List for {group_name}", ""]
+    lines.extend(_render_item(item) for item in open_items)
+    if not open_items:
+        lines.append("_Nothing to do right now._")
+    if done_items:
+        lines.extend(["", "**Recently done**"])
+        lines.extend(_render_item(item) for item in done_items[-TODO_DONE_SHOWN:][::-1])
+    return "\n".join(lines)
+
+def _plan_changes(open_items, result, members):
+    # Turn the model's proposed list into events against the items it was shown.
+    # Nothing is ever removed: items it leaves out keep their place after the
+    # ones it lists, and only ids it reports under "done" are closed. Items
+    # added while it was thinking are not in open_items, so they are left alone.
+    if not isinstance(result, dict) or not isinstance(result.get('items'), list):
+        raise ValueError("expected a JSON object with an 'items' list")
+    base = {item['id']: item for item in open_items}
+    events = []
+    order = []
+    for entry in result['items']:
+        if not isinstance(entry, dict):
+            continue
+        text = str(entry.get('text') or "").strip()
+        if not text:
+            continue
+        owner = entry.get('owner') if isinstance(entry.get('owner'), str) and entry['owner'] in members else None
+        item = base.get(entry['id']) if isinstance(entry.get('id'), str) else None
+        if item is not None and item['id'] not in order:
+            fields = {}
+            if text != item['text']:
+                fields['text'] = text
+            if owner and owner != item['owner']:
+                fields['owner'] = owner
+            if fields:
+                events.append(update_event(item['id'], **fields))
+        elif len(order) < TODO_MAX_OPEN_ITEMS:
+            # The cap only limits what the model may add, never what users added
+            item = new_todo_item(text, owner)
+            events.append({'op': 'add', 'item': item})
+        else:
+            continue
+        order.append(item['id'])
+
+    done = {item_id for item_id in result.get('done') or [] if isinstance(item_id, str)}
+    events.extend(update_event(item_id, status='done') for item_id in base if item_id in done)
+    events.append({'op': 'reorder', 'order': order})
+    return events
+
+def create_or_update_todo_list(group_name, group_agent_id, new_item=None, use_cache=True):
+    # The new item is stored right away; the LLM pass only reprioritizes.
+    # Concurrent passes for one group are coalesced, and items added while
+    # one is running are picked up by the next.
+    store = get_todo_store()
+    added_id = store.add(group_name, new_item)['id'] if new_item else None
+    if TODO_REPRIORITIZE:
+        artifact_flights.run(
+            (group_name, "todo"),
+            lambda added_ids: _reprioritize_todo_list(group_name, use_cache),
+            added_id,
+        )
+    return render_todo_list(group_name, store.items(group_name))
+
+@traced("todo.reprioritize")
+def _reprioritize_todo_list(group_name, use_cache):
+    store = get_todo_store()
     members = get_group_members(group_name)
-    todo_content = f"To-Do List for {group_name}\n\n"
-
-    # Load existing todo list
-    existing_todo = load_group_data(group_name, "todo")
-    if existing_todo:
-        todo_content += "Existing todo items:\n" + existing_todo + "\n\n"
-
-    # Get data for the last 7 days
-    # TODO: Fix function calls to get proper date range
-    # end_date = datetime.now()
-    # start_date = end_date - timedelta(days=7)
-    end_date = None
-    start_date = None
-
-    for username, agent_id in members.items():
-        agent_data = get_comprehensive_agent_data(agent_id, start_date, end_date)
-        
-        todo_content += f"User: {username}\n"
-        
-        # Process messages to find todo-related content
-        todo_content += "Recent todo-related messages:\n"
-        for message in agent_data['messages'][::-1]:
-            if message.role == MessageRole.user:
-                message_data = json.loads(message.text)
-                if message_data['type'] == 'user_message' and ('todo' in message_data['message'].lower() or 'task' in message_data['message'].lower()):
-                    todo_content += f"User ({message_data['time']}): {message_data['message']}\n"
-            elif message.role == MessageRole.assistant:
-                for tool_call in message.tool_calls:
-                    if tool_call.function.name == 'send_message' and ('todo' in tool_call.function.arguments.lower() or 'task' in tool_call.function.arguments.lower()):
-                        tool_call_data = json.loads(tool_call.function.arguments)
-                        todo_content += f"Assistant: {tool_call_data['message']}\n"
-        
-        todo_content += "\n"
-        
-        # Add recent archival memory passages related to todos
-        if agent_data['archival_memory_passages']:
-            todo_content += "Recent todo-related memories:\n"
-            for passage in agent_data['archival_memory_passages']:
-                if 'todo' in passage.text.lower() or 'task' in passage.text.lower():
-                    todo_content += f"- {passage.text}\n" 
-        
-        todo_content += "\n"
-
-    if new_item:
-        todo_content += f"\nNew item to be added: {new_item}\n"
-
-    # Use OpenAI's GPT-4o-mini to update the todo list
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant tasked with updating a to-do list for a group."},
-            {"role": "user", "content": f"Based on the following information about group members, existing todo items, and any new item, update the to-do list for the group. Return just the list, with no other text. The list should contain no more than 10 items total. If there's a new item, make sure to incorporate it. Prioritize the most important and urgent tasks. Format each item as a Markdown checkbox, like this: '- [ ] Task description'. Group similar tasks together. Only add or remove items if necessary based on the recent information:\n\n{todo_content}"}
-        ]
+    open_items = [item for item in store.items(group_name) if item['status'] == 'open']
+
+    prompt = PromptBuilder()
+    prompt.add(f"To-Do List for {group_name}\n")
+    if open_items:
+        prompt.add("Existing todo items (id | owner | task):\n" + "\n".join(
+            f"- {item['id']} | {item['owner'] or '-'} | {item['text']}" for item in open_items
+        ) + "\n")
+
+    # Only the last week of activity is relevant to open tasks
+    start_date = datetime.now(timezone.utc) - timedelta(days=TODO_WINDOW_DAYS)
+
+    # Snippet count is bounded here; the prompt builder then enforces the token budget
+    per_member_limit = max(TODO_MIN_SNIPPETS_PER_MEMBER, TODO_MAX_SNIPPETS // max(len(members), 1))
+
+    snapshots = get_group_snapshots(members)
+    if use_map_reduce(members):
+        # Large groups: merge cached per-member summaries instead of raw snippets
+        summaries = summarize_members(
+            group_name, "todo", members, snapshots, TODO_MEMBER_FOCUS,
+            lambda section, agent_id, agent_data: _add_candidates(section, agent_data, TODO_MAX_SNIPPETS, start_date, agent_id),
+        )
+        for username, summary in summaries.items():
+            prompt.section(f"User: {username}").add_part("Summary of todo-related activity:", [summary])
+    else:
+        for username, agent_data in snapshots.items():
+            _add_candidates(prompt.section(f"User: {username}"), agent_data, per_member_limit, start_date, members[username])
+
+    todo_content = prompt.build()
+
+    # Use OpenAI's GPT-4o-mini to reprioritize the todo list
+    response = cached_chat_completion(
+        "gpt-4o-mini",
+        "You are a helpful assistant tasked with maintaining a to-do list for a group. You reply with JSON only.",
+        f"Based on the following information about group members and the existing todo items, update the to-do list for the group. List the existing items in priority order, most important and urgent first, grouping similar tasks together. Keep the id of every existing item, and use null as the id of new items. Only add items if the recent information calls for it, keeping the list to no more than {TODO_MAX_OPEN_ITEMS} items. Existing items are never deleted: list the ids of existing items the recent information shows are finished under \"done\". Reply with a JSON object of the form {{\"items\": [{{\"id\": \"...\", \"text\": \"Task description\", \"owner\": \"username or null\"}}], \"done\": [\"id\"]}}, with items in priority order:\n\n{todo_content}",
+        use_cache=use_cache,
+        response_format={"type": "json_object"},
     )
 
-    updated_todo = response.choices[0].message.content
-    
-    # Ensure the todo list starts with a header
-    if not updated_todo.startswith("##"):
-        updated_todo = f"## To-Do List for {group_name}\n\n" + updated_todo
+    try:
+        events = _plan_changes(open_items, json.loads(response), members)
+    except ValueError:
+        logger.warning("Ignoring malformed todo reprioritization for group %s", group_name, exc_info=True)
+        return
+    store.apply_batch(group_name, events)
 
-    # Save the updated todo list
-    save_group_data(group_name, "todo", updated_todo)
+def add_todo_item(item, group_name, group_agent_id, owner=None):
+    # A local append; the scheduler reprioritizes the list in the background
+    get_todo_store().add(group_name, item, owner)
+    return get_todo_list(group_name, group_agent_id)
 
-    return updated_todo
+def complete_todo_item(item_id, group_name):
+    return get_todo_store().complete(group_name, item_id)
 
-def add_todo_item(item, group_name, group_agent_id):
-    return create_or_update_todo_list(group_name, group_agent_id, new_item=item)
+def remove_todo_item(item_id, group_name):
+    return get_todo_store().remove(group_name, item_id)
 
 def get_todo_list(group_name, group_agent_id):
-    existing_todo = load_group_data(group_name, "todo")
-    if existing_todo:
-        return existing_todo
-    return create_or_update_todo_list(group_name, group_agent_id)
+    return render_todo_list(group_name, get_todo_store().items(group_name))
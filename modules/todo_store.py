@@ -0,0 +1,172 @@
+import copy
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from modules.storage import get_storage
+
+TODO_LOG = "todo_events"
+TODO_COMPACT_EVENTS = int(os.getenv("WIS_TODO_COMPACT_EVENTS", "200"))
+
+LEGACY_TODO_LINE = re.compile(r"^\s*[-*]\s*\[( |x|X)\]\s*(.+?)\s*$")
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def new_todo_item(text, owner=None):
+    now = _now()
+    return {
+        'id': uuid.uuid4().hex[:8],
+        'text': text,
+        'status': 'open',
+        'owner': owner,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+def update_event(item_id, **fields):
+    fields['updated_at'] = _now()
+    return {'op': 'update', 'id': item_id, 'fields': fields}
+
+def apply_event(items, event):
+    # items is an insertion-ordered dict of id -> item, in priority order
+    op = event['op']
+    if op == 'add':
+        items[event['item']['id']] = dict(event['item'])
+    elif op == 'update':
+        item = items.get(event['id'])
+        if item is not None:
+            item.update(event['fields'])
+    elif op == 'remove':
+        items.pop(event['id'], None)
+    elif op == 'reorder':
+        # Items the new order doesn't mention, e.g. ones added concurrently, keep their place after it
+        ordered = {item_id: items[item_id] for item_id in event['order'] if item_id in items}
+        for item_id, item in items.items():
+            ordered.setdefault(item_id, item)
+        items.clear()
+        items.update(ordered)
+    elif op == 'batch':
+        for sub_event in event['events']:
+            apply_event(items, sub_event)
+
+def parse_legacy_todo(markdown):
+    items = []
+    for line in markdown.splitlines():
+        match = LEGACY_TODO_LINE.match(line)
+        if match:
+            item = new_todo_item(match.group(2))
+            if match.group(1) != " ":
+                item['status'] = 'done'
+            items.append(item)
+    return items
+
+class TodoStore:
+    """Per-group todo items kept as an append-only event log.
+
+    Every change is one appended event that is also applied to an in-memory
+    copy of the list, so adding, completing or removing an item never
+    rewrites it. Reads first catch up with events appended by other
+    processes. Once a group's log grows past ``compact_events`` it is folded
+    into a snapshot.
+    """
+
+    def __init__(self, storage=None, compact_events=TODO_COMPACT_EVENTS):
+        self.storage = storage or get_storage()
+        self.compact_events = compact_events
+        self._lock = threading.RLock()
+        self._groups = {}  # group -> {'items', 'seq', 'events' since the snapshot}
+
+    def _load_snapshot(self, group_name):
+        snapshot = self.storage.load_group_snapshot(group_name, TODO_LOG) or {'seq': 0, 'state': []}
+        items = {item['id']: item for item in snapshot['state']}
+        return {'items': items, 'seq': snapshot['seq'], 'events': 0}
+
+    def _state(self, group_name):
+        # Called with the lock held
+        state = self._groups.get(group_name)
+        if state is None:
+            state = self._groups[group_name] = self._load_snapshot(group_name)
+            if state['seq'] == 0 and not self.storage.load_group_events(group_name, TODO_LOG):
+                self._import_legacy(group_name)
+                state = self._groups[group_name]
+
+        while True:
+            for seq, event in self.storage.load_group_events(group_name, TODO_LOG, state['seq']):
+                if event['op'] == 'compacted':
+                    if event['upto'] > state['seq']:
+                        break
+                else:
+                    apply_event(state['items'], event)
+                    state['events'] += 1
+                state['seq'] = seq
+            else:
+                return state
+            # Another process compacted events we had not seen yet; start over from its snapshot
+            state = self._groups[group_name] = self._load_snapshot(group_name)
+
+    def _import_legacy(self, group_name):
+        # Lists saved before the structured store existed were a single Markdown blob
+        legacy = self.storage.load_group_data(group_name, "todo")
+        if isinstance(legacy, str):
+            items = parse_legacy_todo(legacy)
+            if items:
+                self._append(group_name, {'op': 'batch', 'events': [{'op': 'add', 'item': item} for item in items]})
+
+    def _append(self, group_name, event):
+        self.storage.append_group_event(group_name, TODO_LOG, event)
+        # Events are idempotent, so catching up applies ours together with any
+        # another process appended since our last read
+        state = self._state(group_name)
+        if state['events'] >= self.compact_events:
+            self.storage.compact_group_events(group_name, TODO_LOG, list(state['items'].values()), state['seq'])
+            state['events'] = 0
+
+    def items(self, group_name):
+        with self._lock:
+            return copy.deepcopy(list(self._state(group_name)['items'].values()))
+
+    def add(self, group_name, text, owner=None):
+        item = new_todo_item(text, owner)
+        with self._lock:
+            self._append(group_name, {'op': 'add', 'item': item})
+        return item
+
+    def update(self, group_name, item_id, **fields):
+        with self._lock:
+            state = self._state(group_name)
+            if item_id not in state['items']:
+                return False
+            self._append(group_name, update_event(item_id, **fields))
+            return True
+
+    def complete(self, group_name, item_id):
+        return self.update(group_name, item_id, status='done')
+
+    def reopen(self, group_name, item_id):
+        return self.update(group_name, item_id, status='open')
+
+    def remove(self, group_name, item_id):
+        with self._lock:
+            state = self._state(group_name)
+            if item_id not in state['items']:
+                return False
+            self._append(group_name, {'op': 'remove', 'id': item_id})
+            return True
+
+    def apply_batch(self, group_name, events):
+        if not events:
+            return
+        with self._lock:
+            self._append(group_name, {'op': 'batch', 'events': events})
+
+_todo_store = None
+_todo_store_lock = threading.Lock()
+
+def get_todo_store():
+    global _todo_store
+    with _todo_store_lock:
+        if _todo_store is None:
+            _todo_store = TodoStore()
+        return _todo_store
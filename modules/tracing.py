@@ -0,0 +1,305 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+TRACING_ENABLED = os.getenv("WIS_TRACING", "0") == "1"
+TRACE_FILE = Path(os.getenv("WIS_TRACE_FILE", "traces.jsonl")).absolute()
+METRICS_FILE = Path(os.getenv("WIS_METRICS_FILE", "metrics.prom")).absolute()
+METRICS_FLUSH_INTERVAL = float(os.getenv("WIS_METRICS_FLUSH_INTERVAL", "10"))
+METRICS_PORT = int(os.getenv("WIS_METRICS_PORT", "0"))
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_span = contextvars.ContextVar("wis_current_span", default=None)
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    def __init__(self, name, attrs, activate=True):
+        self.name = name
+        self.attrs = attrs
+        self.activate = activate
+        self._token = None
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if self.activate:
+            self._token = _current_span.set(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        if self._token is not None:
+            _current_span.reset(self._token)
+        _exporter.submit({
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(duration * 1000, 3),
+            'attrs': self.attrs,
+            'error': exc_type.__name__ if exc_type else None,
+        })
+        return False
+
+def span(name, **attrs):
+    """Time a block of code as a span; ``set()`` on the result records attributes.
+
+    Numeric attributes such as ``prompt_tokens``, ``payload_bytes`` or
+    ``cache_hit`` are also summed per span name for the Prometheus export.
+    With tracing disabled this returns a shared no-op object.
+    """
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+def annotate(**attrs):
+    # Record attributes on the innermost open span, if any
+    current = _current_span.get() if TRACING_ENABLED else None
+    if current is not None:
+        current.set(**attrs)
+
+def traced(name):
+    # Decided once at decoration time, so disabled tracing leaves the function untouched
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                # Not made the current span: a generator can be resumed from another context
+                with Span(name, {}, activate=False):
+                    yield from fn(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def payload_bytes(*args, **kwargs):
+    try:
+        return len(json.dumps([args, kwargs], default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return None
+
+def _usage_attrs(result):
+    usage = getattr(result, 'usage', None)
+    if usage is None:
+        return {}
+    attrs = {}
+    for attr, source in (('prompt_tokens', 'prompt_tokens'), ('completion_tokens', 'completion_tokens'),
+                         ('prompt_tokens', 'input_tokens'), ('completion_tokens', 'output_tokens')):
+        value = getattr(usage, source, None)
+        if isinstance(value, int):
+            attrs[attr] = value
+    return attrs
+
+class TracedClient:
+    """Proxy that records a span for every method called on a client.
+
+    Attributes listed in ``namespaces`` (e.g. ``chat`` and ``completions`` for
+    ``client.chat.completions.create``) are proxied too; any other
+    attribute is returned as is, so identity checks on things like letta's
+    interface buffer keep working.
+    """
+
+    def __init__(self, client, prefix, namespaces=()):
+        self._client = client
+        self._prefix = prefix
+        self._namespaces = namespaces
+
+    def __getattr__(self, name):
+        value = getattr(self._client, name)
+        if name in self._namespaces:
+            return TracedClient(value, f"{self._prefix}.{name}", self._namespaces)
+        if not callable(value) or name.startswith("_"):
+            return value
+
+        span_name = f"{self._prefix}.{name}"
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            with span(span_name, payload_bytes=payload_bytes(*args, **kwargs)) as current:
+                result = value(*args, **kwargs)
+                current.set(**_usage_attrs(result))
+                return result
+        return call
+
+def trace_client(client, prefix, namespaces=()):
+    return TracedClient(client, prefix, namespaces) if TRACING_ENABLED else client
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Exporter:
+    """Writes finished spans to JSONL and keeps per-span aggregates for Prometheus.
+
+    Spans are handed over through a queue, so the traced code only pays for
+    building one dict; file I/O and aggregation happen on a daemon thread.
+    """
+
+    def __init__(self, trace_file=TRACE_FILE, metrics_file=METRICS_FILE, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._stats = {}  # span name -> {'count', 'errors', 'sum', 'buckets', 'attrs'}
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._trace_file = None
+
+    def submit(self, record):
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+
+    def _start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _aggregate(self, record):
+        with self._lock:
+            stats = self._stats.setdefault(record['name'], {
+                'count': 0, 'errors': 0, 'sum': 0.0, 'buckets': [0] * len(DURATION_BUCKETS), 'attrs': {},
+            })
+            seconds = record['duration_ms'] / 1000
+            stats['count'] += 1
+            stats['sum'] += seconds
+            if record['error']:
+                stats['errors'] += 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][index] += 1
+            for attr, value in record['attrs'].items():
+                if isinstance(value, (bool, int, float)):
+                    stats['attrs'][attr] = stats['attrs'].get(attr, 0) + value
+
+    def _write(self, record):
+        # Called with _write_lock held
+        if self._trace_file is None:
+            self._trace_file = open(self.trace_file, "a")
+        self._aggregate(record)
+        self._trace_file.write(json.dumps(record, default=str) + "\n")
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0, next_flush - time.monotonic()))
+            except queue.Empty:
+                record = None
+            if record is not None:
+                with self._write_lock:
+                    self._write(record)
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def flush(self):
+        # Also runs at exit, since the exporter thread is a daemon
+        with self._write_lock:
+            while True:
+                try:
+                    self._write(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._trace_file is not None:
+                self._trace_file.flush()
+        if self._thread is not None:
+            self.write_prometheus()
+
+    def render_prometheus(self):
+        with self._lock:
+            stats = {name: dict(values, attrs=dict(values['attrs'])) for name, values in self._stats.items()}
+        lines = [
+            "# HELP wis_span_duration_seconds Duration of traced spans.",
+            "# TYPE wis_span_duration_seconds histogram",
+        ]
+        for name, values in sorted(stats.items()):
+            label = f'span="{_escape(name)}"'
+            for bound, count in zip(DURATION_BUCKETS, values['buckets']):
+                lines.append(f'wis_span_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'wis_span_duration_seconds_bucket{{{label},le="+Inf"}} {values["count"]}')
+            lines.append(f"wis_span_duration_seconds_sum{{{label}}} {values['sum']:.6f}")
+            lines.append(f"wis_span_duration_seconds_count{{{label}}} {values['count']}")
+        lines.extend(["# HELP wis_span_errors_total Spans that raised.", "# TYPE wis_span_errors_total counter"])
+        for name, values in sorted(stats.items()):
+            lines.append(f'wis_span_errors_total{{span="{_escape(name)}"}} {values["errors"]}')
+        lines.extend([
+            "# HELP wis_span_attribute_total Sum of numeric span attributes such as tokens, bytes and cache hits.",
+            "# TYPE wis_span_attribute_total counter",
+        ])
+        for name, values in sorted(stats.items()):
+            for attr, total in sorted(values['attrs'].items()):
+                lines.append(f'wis_span_attribute_total{{span="{_escape(name)}",attribute="{_escape(attr)}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # Replace atomically so a scraper reading the file never sees half of it
+        fd, tmp_path = tempfile.mkstemp(dir=self.metrics_file.parent, prefix=f".{self.metrics_file.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, self.metrics_file)
+
+_exporter = _Exporter()
+
+def render_prometheus():
+    return _exporter.render_prometheus()
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve the Prometheus text format on ``/metrics`` from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
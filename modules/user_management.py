@@ -1,18 +1,19 @@
-import json
-from pathlib import Path
-from letta import create_client
+from modules.storage import get_storage
+from modules.clients import get_letta_client
+from modules.tracing import traced
 from letta.schemas.memory import ChatMemory, Memory, ArchivalMemorySummary, RecallMemorySummary
 from letta.schemas.message import Message
 from letta.schemas.passage import Passage
-from typing import List, Optional
-from datetime import datetime
+from typing import Iterator, List, Optional
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import logging
+import os
+import threading
 import uuid  # Add this import at the top of the file
 import pytz  # Add this import at the top of the file
 
-USERS_FILE = Path("users.json")
-GROUPS_FILE = Path("groups.json")
-letta_client = create_client()
-
 AGENT_PERSONA = """
 I am a digital companion and assistant. I am not human, nor do I try to be. I fully embrace my identity as an agent, and my mission is to be the most reliable and helpful digital partner to my user.
 
@@ -35,158 +36,162 @@ I am a group management AI assistant designed to facilitate collaboration and co
 I strive to create a harmonious and productive environment for all group members, ensuring that everyone's needs and preferences are considered. I can adapt my communication style to suit the group's dynamics and help foster a sense of community and mutual support.
 """
 
+storage = get_storage()
+
+STARTUP_MAX_WORKERS = int(os.getenv("WIS_STARTUP_MAX_WORKERS", "4"))
+HISTORY_PAGE_SIZE = int(os.getenv("WIS_HISTORY_PAGE_SIZE", "100"))
+
+# Set once every known group has been reconciled at startup
+groups_ready = threading.Event()
+
+logger = logging.getLogger(__name__)
+
 def load_users():
-    if USERS_FILE.exists():
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return storage.users()
 
 def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f)
+    storage.replace_users(users)
 
 def load_groups():
-    if GROUPS_FILE.exists():
-        with open(GROUPS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return storage.groups()
 
 def save_groups(groups):
-    with open(GROUPS_FILE, "w") as f:
-        json.dump(groups, f)
+    storage.replace_groups(groups)
 
 def authenticate(username, password):
-    users = load_users()
-    if username in users and users[username]['password'] == password:
+    user_data = storage.get_user(username)
+    if user_data is not None and user_data['password'] == password:
         return True
     return False
 
 def create_group_agent(group_name):
     agent_name = f"group_{group_name}_{uuid.uuid4().hex[:8]}"
-    agent_state = letta_client.create_agent(
+    agent_state = get_letta_client().create_agent(
         name=agent_name,
         memory=ChatMemory(
             persona=GROUP_AGENT_PERSONA,
             human=f"This is the group agent for {group_name}"
         )
     )
-    agent_id = letta_client.get_agent_id(agent_name)
+    agent_id = get_letta_client().get_agent_id(agent_name)
     return agent_id, agent_name
 
 def register_user(username, password, group):
-    users = load_users()
-    groups = load_groups()
-    
-    if username not in users:
-        # Create user agent
-        existing_names = {user_data['agent_name'] for user_data in users.values()}
-        agent_name = generate_unique_agent_name(existing_names)
-        agent_state = letta_client.create_agent(
-            name=agent_name,
-            memory=ChatMemory(
-                persona=AGENT_PERSONA,
-                human=f"The user's username is {username}"
-            )
+    if storage.get_user(username) is not None:
+        return False
+
+    # Create user agent
+    agent_name = generate_unique_agent_name(storage.has_agent_name)
+    agent_state = get_letta_client().create_agent(
+        name=agent_name,
+        memory=ChatMemory(
+            persona=AGENT_PERSONA,
+            human=f"The user's username is {username}"
         )
-        agent_id = letta_client.get_agent_id(agent_name)
-
-        # Create or get group agent
-        if group not in groups:
-            group_agent_id, group_agent_name = create_group_agent(group)
-            groups[group] = {
-                'agent_id': group_agent_id,
-                'agent_name': group_agent_name,
-                'members': [username]
-            }
-            save_groups(groups)
-        else:
-            groups[group]['members'].append(username)
-            save_groups(groups)
-
-        users[username] = {
-            'password': password,
-            'agent_id': agent_id,
-            'agent_name': agent_name,
-            'group': group
-        }
-
-        save_users(users)
-        return True
-    return False
+    )
+    agent_id = get_letta_client().get_agent_id(agent_name)
+
+    # Create group agent if needed; the group row itself is written in the same transaction as the user
+    new_group = None
+    if storage.get_group(group) is None:
+        group_agent_id, group_agent_name = create_group_agent(group)
+        new_group = {'agent_id': group_agent_id, 'agent_name': group_agent_name}
+
+    stored_group = storage.add_user(username, {
+        'password': password,
+        'agent_id': agent_id,
+        'agent_name': agent_name,
+        'group': group
+    }, new_group)
+
+    # Another registration won the race; drop the agents we created for nothing
+    if stored_group is None:
+        get_letta_client().delete_agent(agent_id)
+    if new_group and (stored_group is None or stored_group.get('agent_id') != new_group['agent_id']):
+        get_letta_client().delete_agent(new_group['agent_id'])
+    return stored_group is not None
 
 def get_user_data(username):
-    users = load_users()
-    if username in users:
-        return f"Agent ID: {users[username]['agent_id']}, Group: {users[username].get('group', 'No group')}"
+    user_data = storage.get_user(username)
+    if user_data is not None:
+        return f"Agent ID: {user_data['agent_id']}, Group: {user_data.get('group', 'No group')}"
     return "User not found"
 
 def get_user_agent_id(username):
-    users = load_users()
-    if username in users:
-        return users[username]['agent_id']
+    user_data = storage.get_user(username)
+    if user_data is not None:
+        return user_data['agent_id']
     return None
 
-def generate_unique_agent_name(existing_names):
+def generate_unique_agent_name(is_taken):
     while True:
         agent_name = f"agent_{uuid.uuid4().hex[:8]}"
-        if agent_name not in existing_names:
+        if not is_taken(agent_name):
             return agent_name
 
 def get_user_group(username):
-    users = load_users()
-    if username in users:
-        return users[username].get('group', 'No group')
+    user_data = storage.get_user(username)
+    if user_data is not None:
+        return user_data.get('group', 'No group')
     return None
 
 def ensure_group_agent_exists(group_name):
-    groups = load_groups()
-    users = load_users()
-    
-    if group_name not in groups or 'agent_id' not in groups[group_name]:
+    group_data = storage.get_group(group_name)
+    if group_data is None or 'agent_id' not in group_data:
         group_agent_id, group_agent_name = create_group_agent(group_name)
-        if group_name not in groups:
-            groups[group_name] = {
-                'agent_id': group_agent_id,
-                'agent_name': group_agent_name,
-                'members': []
-            }
-        else:
-            groups[group_name]['agent_id'] = group_agent_id
-            groups[group_name]['agent_name'] = group_agent_name
-    
+        group_data = storage.claim_group_agent(group_name, group_agent_id, group_agent_name)
+        if group_data['agent_id'] != group_agent_id:
+            get_letta_client().delete_agent(group_agent_id)
+
     # Ensure members list is populated
-    if not groups[group_name]['members']:
-        groups[group_name]['members'] = [
-            username for username, user_data in users.items()
-            if user_data.get('group') == group_name
+    if not group_data['members']:
+        members = storage.users_in_group(group_name)
+        if members:
+            storage.add_group_members(group_name, members)
+
+    return group_data['agent_id']
+
+def _reconcile_group(group_name):
+    # One group failing, e.g. letta being unavailable, must not stop the others
+    try:
+        ensure_group_agent_exists(group_name)
+    except Exception:
+        logger.exception("Could not reconcile group %s; its agent is created on next login", group_name)
+
+def reconcile_groups(max_workers=STARTUP_MAX_WORKERS):
+    # Read the registry once and only touch groups that are missing an agent or members
+    try:
+        groups = storage.groups()
+        group_names = storage.group_names()
+        incomplete = [
+            group_name for group_name in group_names
+            if group_name not in groups or 'agent_id' not in groups[group_name] or not groups[group_name]['members']
         ]
-    
-    save_groups(groups)
-    return groups[group_name]['agent_id']
+        if incomplete:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reconcile-groups") as executor:
+                list(executor.map(_reconcile_group, incomplete))
+        return group_names
+    finally:
+        groups_ready.set()
 
 def get_group_agent_id(group_name):
     return ensure_group_agent_exists(group_name)
 
 def login(username, password):
-    users = load_users()
-    if username in users and users[username]['password'] == password:
-        group = users[username].get('group')
+    if authenticate(username, password):
+        group = storage.get_user(username).get('group')
         if group:
             ensure_group_agent_exists(group)
         return True
     return False
 
 def get_group_members(group_name):
-    groups = load_groups()
-    users = load_users()
-    if group_name in groups:
-        return {username: users[username]['agent_id'] for username in groups[group_name]['members']}
-    return {}
+    return storage.group_members(group_name)
 
 def get_agent_memories(agent_id: str):
-    in_context_memory = letta_client.get_in_context_memory(agent_id)
-    archival_memory_summary = letta_client.get_archival_memory_summary(agent_id)
-    recall_memory_summary = letta_client.get_recall_memory_summary(agent_id)
+    in_context_memory = get_letta_client().get_in_context_memory(agent_id)
+    archival_memory_summary = get_letta_client().get_archival_memory_summary(agent_id)
+    recall_memory_summary = get_letta_client().get_recall_memory_summary(agent_id)
     return in_context_memory, archival_memory_summary, recall_memory_summary
 
 def format_datetime(dt: datetime) -> str:
@@ -194,16 +199,65 @@ def format_datetime(dt: datetime) -> str:
     localized_dt = dt.astimezone(pacific_tz)
     return localized_dt.strftime("%Y-%m-%d %I:%M:%S %p %Z%z")
 
+def as_utc(dt: datetime) -> datetime:
+    # letta stores UTC timestamps, older versions without tzinfo
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+def _iter_history(fetch, agent_id, start_date, end_date, page_size):
+    # letta's before/after are id cursors, not dates, so the window is applied here while
+    # walking backwards in time, using the oldest item of each page as the next cursor
+    start = as_utc(start_date) if start_date else None
+    end = as_utc(end_date) if end_date else None
+    cursor = None
+    previous_ids = set()
+    while True:
+        page = fetch(agent_id, before=cursor, limit=page_size)
+        fresh = [item for item in page if item.id not in previous_ids]
+        if not fresh:
+            return
+        fresh.sort(key=lambda item: as_utc(item.created_at), reverse=True)
+        for item in fresh:
+            created_at = as_utc(item.created_at)
+            if end is not None and created_at > end:
+                continue
+            if start is not None and created_at < start:
+                return
+            yield item
+        if len(page) < page_size:
+            return
+        cursor = fresh[-1].id
+        previous_ids = {item.id for item in fresh}
+
+def iter_messages(agent_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, page_size: int = HISTORY_PAGE_SIZE) -> Iterator[Message]:
+    """Yield the agent's messages newest first, fetching one page at a time.
+
+    Only messages created within ``[start_date, end_date]`` are yielded, and
+    no page older than ``start_date`` is ever requested, so a consumer that
+    stops early only pays for the pages it read.
+    """
+    return _iter_history(
+        lambda *args, **kwargs: get_letta_client().get_messages(*args, **kwargs), agent_id, start_date, end_date, page_size
+    )
+
+def iter_archival_memory(agent_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, page_size: int = HISTORY_PAGE_SIZE) -> Iterator[Passage]:
+    """Yield the agent's archival passages newest first, fetching one page at a time."""
+    return _iter_history(
+        lambda *args, **kwargs: get_letta_client().get_archival_memory(*args, **kwargs), agent_id, start_date, end_date, page_size
+    )
+
 def get_messages_by_date_range(agent_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, limit: Optional[int] = 1000) -> List[Message]:
-    start_str = format_datetime(start_date) if start_date else None
-    end_str = format_datetime(end_date) if end_date else None
-    return letta_client.get_messages(agent_id, after=start_str, before=end_str, limit=limit)
+    return list(islice(iter_messages(agent_id, start_date, end_date), limit))
 
 def get_archival_memory_by_date_range(agent_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, limit: Optional[int] = 1000) -> List[Passage]:
-    start_str = format_datetime(start_date) if start_date else None
-    end_str = format_datetime(end_date) if end_date else None
-    return letta_client.get_archival_memory(agent_id, after=start_str, before=end_str, limit=limit)
+    return list(islice(iter_archival_memory(agent_id, start_date, end_date), limit))
+
+def get_messages_after(agent_id: str, after: Optional[str] = None, limit: Optional[int] = 1000) -> List[Message]:
+    return get_letta_client().get_messages(agent_id, after=after, limit=limit)
+
+def get_archival_memory_after(agent_id: str, after: Optional[str] = None, limit: Optional[int] = 1000) -> List[Passage]:
+    return get_letta_client().get_archival_memory(agent_id, after=after, limit=limit)
 
+@traced("agent_data.comprehensive")
 def get_comprehensive_agent_data(agent_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
     in_context_memory, archival_memory_summary, recall_memory_summary = get_agent_memories(agent_id)
     
@@ -1,23 +1,96 @@
+import io
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from modules.clients import get_openai_client
+from modules.call_governor import governed_call
+from modules.tracing import traced, annotate
 
-# Load environment variables
-load_dotenv()
+try:
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+except ImportError:
+    AudioSegment = None
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Whisper works on 16 kHz mono internally, so anything more is wasted upload
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_FORMAT = os.getenv("WIS_AUDIO_FORMAT", "mp3")
+AUDIO_BITRATE = os.getenv("WIS_AUDIO_BITRATE", "32k")
+AUDIO_CHUNK_SECONDS = float(os.getenv("WIS_AUDIO_CHUNK_SECONDS", "120"))
+AUDIO_SILENCE_MIN_MS = 400
+AUDIO_SILENCE_THRESHOLD_DB = 16  # below the recording's average loudness
+AUDIO_MAX_WORKERS = int(os.getenv("WIS_AUDIO_MAX_WORKERS", "4"))
 
+# Separate from the multimodal pool that calls process_voice_input, so chunks never wait on their parent
+_executor = ThreadPoolExecutor(max_workers=AUDIO_MAX_WORKERS, thread_name_prefix="transcribe")
+
+def load_speech_audio(audio_file):
+    # Downmix and resample. Returns None without pydub/ffmpeg or for
+    # anything they cannot decode, in which case the file is sent unchanged.
+    if AudioSegment is None:
+        return None
+    try:
+        audio = AudioSegment.from_file(audio_file)
+    except Exception:
+        return None
+    return audio.set_channels(1).set_frame_rate(AUDIO_SAMPLE_RATE)
+
+def split_on_silence(audio, chunk_ms):
+    """Return ``(start, end)`` millisecond ranges of at most ``chunk_ms``.
+
+    Each cut is placed in the middle of the latest pause in the second half
+    of the chunk, so words are not split; without a pause it is a hard cut.
+    """
+    if len(audio) <= chunk_ms:
+        return [(0, len(audio))]
+    silences = detect_silence(
+        audio,
+        min_silence_len=AUDIO_SILENCE_MIN_MS,
+        silence_thresh=audio.dBFS - AUDIO_SILENCE_THRESHOLD_DB,
+        seek_step=50,
+    )
+    cut_points = [(start + end) // 2 for start, end in silences]
+    ranges = []
+    start = 0
+    while len(audio) - start > chunk_ms:
+        limit = start + chunk_ms
+        candidates = [point for point in cut_points if start + chunk_ms // 2 <= point <= limit]
+        cut = candidates[-1] if candidates else limit
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, len(audio)))
+    return ranges
+
+def _transcribe(filename, data):
+    transcript = governed_call("openai", "whisper-1", lambda: get_openai_client().audio.transcriptions.create(
+        model="whisper-1",
+        file=(filename, data)
+    ))
+    return transcript.text
+
+def _transcribe_segment(segment, index):
+    output = io.BytesIO()
+    segment.export(output, format=AUDIO_FORMAT, bitrate=AUDIO_BITRATE)
+    data = output.getvalue()
+    return _transcribe(f"chunk_{index}.{AUDIO_FORMAT}", data), len(data)
+
+@traced("voice.transcribe")
 def process_voice_input(audio_file):
     if not audio_file:
         return "No voice input provided."
-    
+
     try:
-        with open(audio_file, "rb") as audio:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=audio
-            )
-        return transcript.text
+        audio = load_speech_audio(audio_file)
+        if audio is None:
+            data = Path(audio_file).read_bytes()
+            annotate(audio_bytes=len(data), upload_bytes=len(data), chunks=1)
+            return _transcribe(Path(audio_file).name, data)
+
+        # Chunks are encoded and transcribed concurrently, then stitched back in order
+        ranges = split_on_silence(audio, int(AUDIO_CHUNK_SECONDS * 1000))
+        futures = [_executor.submit(_transcribe_segment, audio[start:end], index) for index, (start, end) in enumerate(ranges)]
+        results = [future.result() for future in futures]
+        annotate(audio_bytes=os.path.getsize(audio_file), upload_bytes=sum(size for _, size in results), chunks=len(results))
+        return " ".join(text.strip() for text, _ in results if text.strip())
     except Exception as e:
         return f"Error processing voice input: {str(e)}"